@@ -1,35 +1,151 @@
 import json
 import math
+import sys
+import numpy as np
 from rtree import index
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Tính khoảng cách giữa 2 điểm theo công thức Haversine (km)"""
+try:
+    import orjson
+except ImportError:  # orjson không bắt buộc, nếu chưa cài thì dùng json chuẩn
+    orjson = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # Numba không bắt buộc, nếu chưa cài thì lọc bằng NumPy
+    njit = None
+
+def haversine_a_np(q_lat_rad, q_lon_rad, q_cos_lat, lat_rad, lon_rad, cos_lat):
+    """Tính đại lượng a của công thức Haversine từ 1 điểm tới mảng các điểm bằng NumPy.
+    Toạ độ đã đổi sang radian và cos(lat) của các điểm đã được tính sẵn."""
+    return np.sin((lat_rad - q_lat_rad)/2)**2 + q_cos_lat * cos_lat * np.sin((lon_rad - q_lon_rad)/2)**2
+
+def haversine_a_threshold(distance_km):
+    """Ngưỡng của a tương ứng với khoảng cách distance_km (a <= ngưỡng <=> khoảng cách <= distance_km)"""
     R = 6371  # Bán kính trái đất (km)
     
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    # asin đơn điệu tăng nên so sánh a thay cho khoảng cách; quá nửa chu vi thì mọi điểm đều thoả
+    return math.sin(min(distance_km / (2*R), math.pi/2))**2
+
+def haversine_a_to_km(a):
+    """Đổi đại lượng a của công thức Haversine sang khoảng cách (km)"""
+    R = 6371  # Bán kính trái đất (km)
     
-    return R * c
+    return 2 * R * np.arcsin(np.sqrt(a))
 
-def lat_lon_to_meters(lat, lon, distance_km):
-    """Chuyển đổi khoảng cách km sang độ lat/lon gần đúng"""
-    # 1 độ latitude ≈ 111 km
-    # 1 độ longitude phụ thuộc vào latitude
-    lat_offset = distance_km / 111.0
-    lon_offset = distance_km / (111.0 * math.cos(math.radians(lat)))
-    return lat_offset, lon_offset
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def hav_within(q_lat_rad, q_lon_rad, q_cos_lat, cos_lat0, flat_thresh, a_thresh,
+                   ids, lat_rad, lon_rad, cos_lat, out_dist):
+        """Lọc thô phẳng + haversine cho các ứng viên trong một vòng lặp (Numba).
+        out_dist[i] = khoảng cách (km) nếu trạm ids[i] thoả mãn, ngược lại -1. Trả về số trạm thoả mãn."""
+        R = 6371.0  # Bán kính trái đất (km)
+        count = 0
+        for i in prange(ids.size):
+            j = ids[i]
+            dlat = lat_rad[j] - q_lat_rad
+            dlon = lon_rad[j] - q_lon_rad
+            dx = dlon * cos_lat0
+            dist = -1.0
+            if dx*dx + dlat*dlat <= flat_thresh:
+                s_lat = math.sin(dlat/2)
+                s_lon = math.sin(dlon/2)
+                a = s_lat*s_lat + q_cos_lat * cos_lat[j] * s_lon*s_lon
+                if a <= a_thresh:
+                    dist = 2 * R * math.asin(math.sqrt(a))
+                    count += 1
+            out_dist[i] = dist
+        return count
+else:
+    hav_within = None
+
+def stream_stations(coords):
+    """Sinh các entry (id, bbox, obj) để bulk load R-Tree"""
+    for i, (lat, lon) in enumerate(coords.tolist()):
+        # R-Tree sử dụng (minx, miny, maxx, maxy)
+        # Với điểm, minx=maxx và miny=maxy
+        # Chỉ lưu id (obj=None, không pickle), dữ liệu trạm tra lại qua gas_stations[id]
+        yield (i, (lon, lat, lon, lat), None)
+
+def format_results(results):
+    """Sinh chuỗi hiển thị cho từng kết quả tìm kiếm"""
+    for i, result in enumerate(results, 1):
+        station = result['station']
+        get = station.get
+        yield (f"\n{i}. {station['name']}\n"
+               f"   Thương hiệu: {get('brand', 'N/A')}\n"
+               f"   Địa chỉ: {get('display_name', 'N/A')}\n"
+               f"   Phường/Xã: {get('ward', 'N/A')}\n"
+               f"   Tỉnh/Thành: {get('province', 'N/A')}\n"
+               f"   Toạ độ: {station['coordinates']}\n"
+               f"   Khoảng cách: {result['distance']:.2f} km\n")
+
+def query(idx, data_bounds, lat_rad, lon_rad, cos_lat, lat, lon, n):
+    """Tìm các trạm trong bán kính n km quanh (lat, lon).
+    Trả về (số ứng viên trong hình vuông, id các trạm, khoảng cách km) đã sắp xếp theo khoảng cách."""
+    # Tính các đại lượng lượng giác của tâm một lần, dùng chung cho bounding box và haversine
+    q_lat_rad = math.radians(lat)
+    q_lon_rad = math.radians(lon)
+    q_cos_lat = math.cos(q_lat_rad)
+    
+    # Tính bounding box cho hình vuông cạnh 2n
+    # 1 độ latitude ≈ 111 km, 1 độ longitude ≈ 111 * cos(latitude) km
+    lat_offset = n / 111.0
+    lon_offset = n / (111.0 * q_cos_lat)
+    
+    min_lat = lat - lat_offset
+    max_lat = lat + lat_offset
+    min_lon = lon - lon_offset
+    max_lon = lon + lon_offset
+    
+    # Hình vuông phủ toàn bộ dữ liệu (data_bounds = (min_lon, min_lat, max_lon, max_lat))
+    # thì mọi trạm đều là ứng viên, bỏ qua R-Tree và lọc thẳng trên mảng toạ độ
+    if (min_lon <= data_bounds[0] and min_lat <= data_bounds[1] and
+            max_lon >= data_bounds[2] and max_lat >= data_bounds[3]):
+        ids = np.arange(lat_rad.size, dtype=np.int64)
+    else:
+        ids = np.array(list(idx.intersection((min_lon, min_lat, max_lon, max_lat))), dtype=np.int64)
+    num_candidates = ids.size
+    
+    # Lọc thô bằng khoảng cách phẳng (equirectangular) trước khi tính haversine.
+    # Dùng cos của vĩ độ xa xích đạo nhất trong hình vuông để không loại nhầm trạm,
+    # cộng thêm 5% cho sai số của phép xấp xỉ phẳng.
+    cos_lat0 = math.cos(math.radians(min(abs(lat) + lat_offset, 90.0)))
+    flat_thresh = (n / 6371.0)**2 * 1.05
+    a_thresh = haversine_a_threshold(n)
+    
+    if hav_within is not None:
+        # Lọc thô + haversine + so sánh ngưỡng trong một kernel, không tạo mảng trung gian
+        out_dist = np.empty(ids.size)
+        hav_within(q_lat_rad, q_lon_rad, q_cos_lat, cos_lat0, flat_thresh, a_thresh,
+                   ids, lat_rad, lon_rad, cos_lat, out_dist)
+        mask = out_dist >= 0
+        ids = ids[mask]
+        distances = out_dist[mask]
+    else:
+        dx = (lon_rad[ids] - q_lon_rad) * cos_lat0
+        dy = lat_rad[ids] - q_lat_rad
+        ids = ids[dx*dx + dy*dy <= flat_thresh]
+        
+        # Lọc theo khoảng cách thực tế (tính haversine cho các ứng viên còn lại một lần)
+        a = haversine_a_np(q_lat_rad, q_lon_rad, q_cos_lat,
+                           lat_rad[ids], lon_rad[ids], cos_lat[ids])
+        
+        # So sánh a với ngưỡng, chỉ đổi sang km cho các trạm thoả mãn
+        hits = np.nonzero(a <= a_thresh)[0]
+        ids = ids[hits]
+        distances = haversine_a_to_km(a[hits])
+    
+    # Sắp xếp theo khoảng cách
+    order = np.argsort(distances, kind='stable')
+    
+    return num_candidates, ids[order], distances[order]
 
 def get_tree_stats(idx, properties):
     """Lấy thông tin thống kê về cây R-Tree"""
     stats = idx.get_bounds()
     
-    # Đếm số lượng entries
-    total_entries = sum(1 for _ in idx.intersection(idx.get_bounds(), objects=True))
+    # Đếm số lượng entries (libspatialindex lưu sẵn, không cần duyệt toàn bộ cây)
+    total_entries = len(idx)
     
     return {
         'bounds': stats,
@@ -41,8 +157,12 @@ def main():
     # Đọc dữ liệu từ file JSON
     print("Đang đọc dữ liệu từ file db_fix.json...")
     try:
-        with open('db_fix.json', 'r', encoding='utf-8') as f:
-            gas_stations = json.load(f)
+        if orjson is not None:
+            with open('db_fix.json', 'rb') as f:
+                gas_stations = orjson.loads(f.read())
+        else:
+            with open('db_fix.json', 'r', encoding='utf-8') as f:
+                gas_stations = json.load(f)
         print(f"Đã đọc thành công {len(gas_stations)} trạm xăng")
     except FileNotFoundError:
         print("Lỗi: Không tìm thấy file db_fix.json")
@@ -51,6 +171,14 @@ def main():
         print("Lỗi: File JSON không hợp lệ")
         return
     
+    # Mảng toạ độ (N, 2) liên tục, song song với gas_stations (dùng cho lọc khoảng cách bằng NumPy)
+    # Tính sẵn radian và cos(lat) một lần để không phải tính lại ở mỗi truy vấn
+    coords = np.fromiter((v for s in gas_stations for v in s['coordinates']),
+                         dtype=np.float64, count=2*len(gas_stations)).reshape(-1, 2)
+    lat_rad = np.radians(coords[:, 0])
+    lon_rad = np.radians(coords[:, 1])
+    cos_lat = np.cos(lat_rad)
+    
     # Nhập giá trị M (số lượng tối đa MBR cho mỗi node)
     while True:
         try:
@@ -69,14 +197,10 @@ def main():
     p.fill_factor = 0.7
     p.near_minimum_overlap_factor = min(M // 2, 32)  # Phải nhỏ hơn capacity
     
-    idx = index.Index(properties=p)
-    
-    # Thêm các trạm xăng vào R-Tree
-    for i, station in enumerate(gas_stations):
-        lat, lon = station['coordinates']
-        # R-Tree sử dụng (minx, miny, maxx, maxy)
-        # Với điểm, minx=maxx và miny=maxy
-        idx.insert(i, (lon, lat, lon, lat), obj=station)
+    # Nạp toàn bộ trạm xăng vào R-Tree một lần (bulk load) thay vì insert từng điểm.
+    # libspatialindex tự sắp xếp và đóng gói các node, nên thứ tự chèn động
+    # không còn ảnh hưởng tới hình dạng cây.
+    idx = index.Index(stream_stations(coords), properties=p)
     
     # Thống kê cây R-Tree
     print("\n" + "="*60)
@@ -84,6 +208,7 @@ def main():
     print("="*60)
     
     stats = get_tree_stats(idx, p)
+    data_bounds = stats['bounds']
     print(f"Tổng số trạm xăng: {stats['total_entries']}")
     print(f"Leaf capacity (M): {M}")
     print(f"Fill factor: {p.fill_factor}")
@@ -118,35 +243,14 @@ def main():
                 print("Khoảng cách phải lớn hơn 0!")
                 continue
             
-            # Tính bounding box cho hình vuông cạnh 2n
-            lat_offset, lon_offset = lat_lon_to_meters(lat, lon, n)
-            
-            min_lat = lat - lat_offset
-            max_lat = lat + lat_offset
-            min_lon = lon - lon_offset
-            max_lon = lon + lon_offset
-            
             # Tìm kiếm trong R-Tree (bounding box)
             print(f"\nĐang tìm kiếm trong vùng hình vuông cạnh {2*n} km...")
-            candidates = list(idx.intersection((min_lon, min_lat, max_lon, max_lat), objects=True))
-            
-            print(f"Tìm thấy {len(candidates)} trạm xăng ứng viên trong vùng")
+            num_candidates, ids, distances = query(idx, data_bounds, lat_rad, lon_rad, cos_lat, lat, lon, n)
             
-            # Lọc theo khoảng cách thực tế
-            results = []
-            for item in candidates:
-                station = item.object
-                st_lat, st_lon = station['coordinates']
-                distance = haversine_distance(lat, lon, st_lat, st_lon)
-                
-                if distance <= n:
-                    results.append({
-                        'station': station,
-                        'distance': distance
-                    })
+            print(f"Tìm thấy {num_candidates} trạm xăng ứng viên trong vùng")
             
-            # Sắp xếp theo khoảng cách
-            results.sort(key=lambda x: x['distance'])
+            results = [{'station': gas_stations[i], 'distance': d}
+                       for i, d in zip(ids.tolist(), distances.tolist())]
             
             # In kết quả
             print(f"\n{'='*60}")
@@ -154,16 +258,9 @@ def main():
             print(f"{'='*60}")
             
             if results:
-                for i, result in enumerate(results, 1):
-                    station = result['station']
-                    dist = result['distance']
-                    print(f"\n{i}. {station['name']}")
-                    print(f"   Thương hiệu: {station.get('brand', 'N/A')}")
-                    print(f"   Địa chỉ: {station.get('display_name', 'N/A')}")
-                    print(f"   Phường/Xã: {station.get('ward', 'N/A')}")
-                    print(f"   Tỉnh/Thành: {station.get('province', 'N/A')}")
-                    print(f"   Toạ độ: {station['coordinates']}")
-                    print(f"   Khoảng cách: {dist:.2f} km")
+                # Ghi toàn bộ kết quả qua stdout (có buffer) thay vì gọi print nhiều lần cho mỗi trạm
+                sys.stdout.writelines(format_results(results))
+                sys.stdout.flush()
             else:
                 print("Không tìm thấy trạm xăng nào trong khoảng cách này.")
             
@@ -2,11 +2,60 @@ import json
 import math
 from typing import List, Tuple, Optional
 from dataclasses import dataclass
+import sys
 import time
 import argparse
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson không bắt buộc, nếu chưa cài thì dùng json chuẩn
+    orjson = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # Numba không bắt buộc, nếu chưa cài thì tính bằng NumPy
+    njit = None
     
 
-@dataclass
+def haversine_distance_np(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Tính khoảng cách Haversine từ 1 điểm tới mảng các điểm (km) bằng NumPy"""
+    R = 6371  # Bán kính trái đất (km)
+    
+    dlat = np.radians(lats - lat)
+    dlon = np.radians(lons - lon)
+    
+    a = np.sin(dlat/2)**2 + math.cos(math.radians(lat)) * np.cos(np.radians(lats)) * np.sin(dlon/2)**2
+    
+    return 2 * R * np.arcsin(np.sqrt(a))
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def hav_within(lat0: float, lon0: float, radius_km: float,
+                   lats: np.ndarray, lons: np.ndarray, out_dist: np.ndarray) -> int:
+        """Tính haversine và so sánh với bán kính trong một vòng lặp (Numba).
+        out_dist[i] = khoảng cách (km) nếu điểm i nằm trong bán kính, ngược lại -1. Trả về số điểm thoả mãn."""
+        R = 6371.0  # Bán kính trái đất (km)
+        lat0_rad = math.radians(lat0)
+        lon0_rad = math.radians(lon0)
+        cos_lat0 = math.cos(lat0_rad)
+        count = 0
+        for i in prange(lats.size):
+            lat_rad = math.radians(lats[i])
+            s_lat = math.sin((lat_rad - lat0_rad)/2)
+            s_lon = math.sin((math.radians(lons[i]) - lon0_rad)/2)
+            a = s_lat*s_lat + cos_lat0 * math.cos(lat_rad) * s_lon*s_lon
+            dist = 2 * R * math.asin(math.sqrt(a))
+            if dist <= radius_km:
+                count += 1
+            else:
+                dist = -1.0
+            out_dist[i] = dist
+        return count
+else:
+    hav_within = None
+
+@dataclass(slots=True)
 class Point:
     """Đại diện cho một điểm trên bản đồ"""
     lat: float
@@ -28,9 +77,11 @@ class Point:
         
         return R * c
 
-@dataclass
+@dataclass(slots=True)
 class MBR:
     """Minimum Bounding Rectangle"""
+    EPSILON = 1  # Độ nới rộng (độ) khi kiểm tra giao với hình vuông tìm kiếm
+    
     min_lat: float
     max_lat: float
     min_lon: float
@@ -52,7 +103,7 @@ class MBR:
         Hình vuông được định nghĩa bởi tâm và nửa cạnh (theo lat/lon).
         """
 
-        EPSILON = 1
+        EPSILON = MBR.EPSILON
         
         # Tính bounds của hình vuông tìm kiếm
         square_min_lat = center_lat - half_side_lat
@@ -114,11 +165,28 @@ class MBR:
 
 class RTreeNode:
     """Node trong R-Tree"""
+    __slots__ = ('is_leaf', 'mbr', 'entries', 'parent', 'arrays')
+    
     def __init__(self, is_leaf: bool = True, parent=None):
         self.is_leaf = is_leaf
         self.mbr: Optional[MBR] = None
         self.entries: List[Tuple[MBR, any]] = []  # (MBR, Point hoặc RTreeNode)
         self.parent = parent
+        # Bản SoA của entries dùng khi tìm kiếm, tạo lại khi node hoặc node con thay đổi:
+        # node lá: toạ độ các điểm (k, 2) [lat, lon]
+        # node nội bộ: MBR các node con (k, 4) [min_lat, max_lat, min_lon, max_lon]
+        self.arrays: Optional[np.ndarray] = None
+    
+    def get_arrays(self) -> np.ndarray:
+        """Lấy (tạo nếu cần) mảng NumPy toạ độ điểm / MBR node con của node"""
+        if self.arrays is None:
+            if self.is_leaf:
+                self.arrays = np.array([(p.lat, p.lon) for _, p in self.entries],
+                                       dtype=np.float64).reshape(-1, 2)
+            else:
+                self.arrays = np.array([(c.mbr.min_lat, c.mbr.max_lat, c.mbr.min_lon, c.mbr.max_lon)
+                                        for _, c in self.entries], dtype=np.float64).reshape(-1, 4)
+        return self.arrays
     
     def is_full(self, max_entries: int) -> bool:
         """Kiểm tra node đã đầy chưa"""
@@ -126,13 +194,26 @@ class RTreeNode:
     
     def update_mbr(self):
         """Cập nhật MBR của node"""
+        self.arrays = None
+        
         if not self.entries:
             self.mbr = None
             return
         
-        mbr = self.entries[0][0]
+        # Tính min/max vào biến cục bộ, chỉ tạo một MBR ở cuối
+        first_mbr = self.entries[0][0]
+        min_lat, max_lat = first_mbr.min_lat, first_mbr.max_lat
+        min_lon, max_lon = first_mbr.min_lon, first_mbr.max_lon
         for entry_mbr, _ in self.entries[1:]:
-            mbr = mbr.expand_to_include_mbr(entry_mbr)
+            if entry_mbr.min_lat < min_lat:
+                min_lat = entry_mbr.min_lat
+            if entry_mbr.max_lat > max_lat:
+                max_lat = entry_mbr.max_lat
+            if entry_mbr.min_lon < min_lon:
+                min_lon = entry_mbr.min_lon
+            if entry_mbr.max_lon > max_lon:
+                max_lon = entry_mbr.max_lon
+        mbr = MBR(min_lat, max_lat, min_lon, max_lon)
         self.mbr = mbr
 
 class RTree:
@@ -153,31 +234,82 @@ class RTree:
         leaf.entries.append((mbr, point))
         leaf.update_mbr()
         
+        # MBR của node lá đã thay đổi, mảng SoA của các node tổ tiên không còn đúng
+        ancestor = leaf.parent
+        while ancestor is not None:
+            ancestor.arrays = None
+            ancestor = ancestor.parent
+        
         # Xử lý split nếu cần
         if len(leaf.entries) > self.max_entries:
             self._handle_overflow(leaf)
     
-    def _choose_leaf(self, node: RTreeNode, mbr: MBR) -> RTreeNode:
-        """Chọn node lá phù hợp để chèn"""
-        if node.is_leaf:
-            return node
+    def bulk_load(self, points: List[Point]):
+        """
+        Xây dựng lại toàn bộ R-Tree từ danh sách điểm bằng Sort-Tile-Recursive (STR).
         
-        # Tìm entry có sự mở rộng diện tích nhỏ nhất
-        best_entry = None
-        min_enlargement = float('inf')
-        min_area = float('inf')
+        Dùng khi đã biết trước toàn bộ dữ liệu: nhanh hơn nhiều so với insert từng điểm
+        và các node ít chồng lấn hơn. Sau khi bulk load vẫn có thể insert thêm điểm.
+        """
+        # Tầng lá
+        nodes = self._str_pack([(MBR.from_point(p), p) for p in points], is_leaf=True)
+        
+        # Gom dần các node thành tầng nội bộ cho tới khi chỉ còn 1 node (root)
+        while len(nodes) > 1:
+            nodes = self._str_pack([(node.mbr, node) for node in nodes], is_leaf=False)
         
-        for entry_mbr, child_node in node.entries:
-            enlarged_mbr = entry_mbr.expand_to_include_mbr(mbr)
-            enlargement = enlarged_mbr.area() - entry_mbr.area()
+        self.root = nodes[0] if nodes else RTreeNode(is_leaf=True)
+        self.root.parent = None
+    
+    def _str_pack(self, entries: List[Tuple[MBR, any]], is_leaf: bool) -> List[RTreeNode]:
+        """Đóng gói các entry thành các node (tối đa max_entries entry/node) theo STR"""
+        if not entries:
+            return []
+        
+        M = self.max_entries
+        num_nodes = math.ceil(len(entries) / M)
+        num_slices = math.ceil(math.sqrt(num_nodes))
+        slice_size = num_slices * M
+        
+        # Sắp xếp theo tâm lat, chia thành các lát (slice)
+        entries = sorted(entries, key=lambda e: e[0].min_lat + e[0].max_lat)
+        
+        nodes = []
+        for i in range(0, len(entries), slice_size):
+            # Trong mỗi lát, sắp xếp theo tâm lon rồi cắt thành các node
+            slice_entries = sorted(entries[i:i + slice_size], key=lambda e: e[0].min_lon + e[0].max_lon)
+            for j in range(0, len(slice_entries), M):
+                node = RTreeNode(is_leaf=is_leaf)
+                node.entries = slice_entries[j:j + M]
+                if not is_leaf:
+                    for _, child in node.entries:
+                        child.parent = node
+                node.update_mbr()
+                nodes.append(node)
+        
+        return nodes
+    
+    def _choose_leaf(self, node: RTreeNode, mbr: MBR) -> RTreeNode:
+        """Chọn node lá phù hợp để chèn"""
+        while not node.is_leaf:
+            # Tìm entry có sự mở rộng diện tích nhỏ nhất
+            best_entry = None
+            min_enlargement = float('inf')
+            min_area = float('inf')
             
-            # Chọn theo enlargement nhỏ nhất, nếu bằng thì chọn theo area nhỏ nhất
-            if enlargement < min_enlargement or (enlargement == min_enlargement and entry_mbr.area() < min_area):
-                min_enlargement = enlargement
-                min_area = entry_mbr.area()
-                best_entry = child_node
+            for entry_mbr, child_node in node.entries:
+                enlarged_mbr = entry_mbr.expand_to_include_mbr(mbr)
+                enlargement = enlarged_mbr.area() - entry_mbr.area()
+                
+                # Chọn theo enlargement nhỏ nhất, nếu bằng thì chọn theo area nhỏ nhất
+                if enlargement < min_enlargement or (enlargement == min_enlargement and entry_mbr.area() < min_area):
+                    min_enlargement = enlargement
+                    min_area = entry_mbr.area()
+                    best_entry = child_node
+            
+            node = best_entry
         
-        return self._choose_leaf(best_entry, mbr)
+        return node
     
     def _handle_overflow(self, node: RTreeNode):
         """Xử lý overflow khi node đầy"""
@@ -235,19 +367,25 @@ class RTree:
         remaining = [e for i, e in enumerate(node.entries) 
                     if i != seed1_idx and i != seed2_idx]
         
+        # MBR và diện tích hiện tại của 2 node, được mở rộng dần khi thêm entry
+        # (không cần quét lại toàn bộ entries bằng update_mbr sau mỗi lần thêm)
+        mbr1 = node1.entries[0][0]
+        mbr2 = node2.entries[0][0]
+        area1 = mbr1.area()
+        area2 = mbr2.area()
+        
         for entry in remaining:
             mbr, data = entry
             
-            # Cập nhật MBR trước khi tính toán
-            node1.update_mbr()
-            node2.update_mbr()
-            
             # Tính enlargement cho mỗi node
-            enlarged1 = node1.mbr.expand_to_include_mbr(mbr)
-            enlarged2 = node2.mbr.expand_to_include_mbr(mbr)
+            enlarged1 = mbr1.expand_to_include_mbr(mbr)
+            enlarged2 = mbr2.expand_to_include_mbr(mbr)
+            
+            enlarged_area1 = enlarged1.area()
+            enlarged_area2 = enlarged2.area()
             
-            enlargement1 = enlarged1.area() - node1.mbr.area()
-            enlargement2 = enlarged2.area() - node2.mbr.area()
+            enlargement1 = enlarged_area1 - area1
+            enlargement2 = enlarged_area2 - area2
             
             # Chọn node để thêm entry
             if enlargement1 < enlargement2:
@@ -256,9 +394,9 @@ class RTree:
                 target_node = node2
             else:
                 # Nếu enlargement bằng nhau, chọn node có diện tích nhỏ hơn
-                if node1.mbr.area() < node2.mbr.area():
+                if area1 < area2:
                     target_node = node1
-                elif node2.mbr.area() < node1.mbr.area():
+                elif area2 < area1:
                     target_node = node2
                 else:
                     # Nếu diện tích cũng bằng nhau, chọn node có ít entries hơn
@@ -266,64 +404,68 @@ class RTree:
             
             target_node.entries.append(entry)
             
+            # Chỉ cập nhật MBR của node vừa được thêm entry
+            if target_node is node1:
+                mbr1, area1 = enlarged1, enlarged_area1
+            else:
+                mbr2, area2 = enlarged2, enlarged_area2
+            
             # Cập nhật parent pointer nếu không phải leaf
             if not node.is_leaf:
                 data.parent = target_node
         
-        # Cập nhật MBR cuối cùng
-        node1.update_mbr()
-        node2.update_mbr()
+        node1.mbr = mbr1
+        node2.mbr = mbr2
         
         return node1, node2
     
     def _linear_pick_seeds(self, entries: List[Tuple[MBR, any]]) -> Tuple[int, int]:
         """Linear Pick Seeds Algorithm - chọn 2 entry xa nhau nhất"""
+        # Duyệt entries một lần, tính đồng thời cho cả 2 chiều:
+        # min của max, max của min (kèm index, lấy index cuối cùng khi bằng nhau)
+        # và min/max tổng thể để chuẩn hoá
+        first = entries[0][0]
+        min_max_lat, max_min_lat = first.max_lat, first.min_lat
+        min_max_lon, max_min_lon = first.max_lon, first.min_lon
+        min_max_lat_idx = max_min_lat_idx = min_max_lon_idx = max_min_lon_idx = 0
+        overall_min_lat, overall_max_lat = first.min_lat, first.max_lat
+        overall_min_lon, overall_max_lon = first.min_lon, first.max_lon
+        
+        for i, (mbr, _) in enumerate(entries):
+            if mbr.max_lat <= min_max_lat:
+                min_max_lat, min_max_lat_idx = mbr.max_lat, i
+            if mbr.min_lat >= max_min_lat:
+                max_min_lat, max_min_lat_idx = mbr.min_lat, i
+            if mbr.max_lon <= min_max_lon:
+                min_max_lon, min_max_lon_idx = mbr.max_lon, i
+            if mbr.min_lon >= max_min_lon:
+                max_min_lon, max_min_lon_idx = mbr.min_lon, i
+            if mbr.min_lat < overall_min_lat:
+                overall_min_lat = mbr.min_lat
+            if mbr.max_lat > overall_max_lat:
+                overall_max_lat = mbr.max_lat
+            if mbr.min_lon < overall_min_lon:
+                overall_min_lon = mbr.min_lon
+            if mbr.max_lon > overall_max_lon:
+                overall_max_lon = mbr.max_lon
+        
         max_separation = -float('inf')
         seed1_idx = 0
         seed2_idx = 1 if len(entries) > 1 else 0
         
-        # Tìm cặp có separation lớn nhất theo từng chiều
-        for dim in ['lat', 'lon']:
-            if dim == 'lat':
-                # Tìm min của max_lat và max của min_lat
-                min_of_max = min(mbr.max_lat for mbr, _ in entries)
-                max_of_min = max(mbr.min_lat for mbr, _ in entries)
-                
-                # Tính width tổng thể
-                overall_min = min(mbr.min_lat for mbr, _ in entries)
-                overall_max = max(mbr.max_lat for mbr, _ in entries)
-                width = overall_max - overall_min
-                
-                if width > 0:
-                    # Tính normalized separation
-                    separation = (max_of_min - min_of_max) / width
-                    
-                    if separation > max_separation:
-                        max_separation = separation
-                        # Tìm index của entry có max_of_min và min_of_max
-                        for i, (mbr, _) in enumerate(entries):
-                            if mbr.min_lat == max_of_min:
-                                seed1_idx = i
-                            if mbr.max_lat == min_of_max:
-                                seed2_idx = i
-            else:  # lon
-                min_of_max = min(mbr.max_lon for mbr, _ in entries)
-                max_of_min = max(mbr.min_lon for mbr, _ in entries)
+        # Chọn chiều có normalized separation lớn nhất
+        for max_of_min, max_of_min_idx, min_of_max, min_of_max_idx, width in (
+                (max_min_lat, max_min_lat_idx, min_max_lat, min_max_lat_idx,
+                 overall_max_lat - overall_min_lat),
+                (max_min_lon, max_min_lon_idx, min_max_lon, min_max_lon_idx,
+                 overall_max_lon - overall_min_lon)):
+            if width > 0:
+                separation = (max_of_min - min_of_max) / width
                 
-                overall_min = min(mbr.min_lon for mbr, _ in entries)
-                overall_max = max(mbr.max_lon for mbr, _ in entries)
-                width = overall_max - overall_min
-                
-                if width > 0:
-                    separation = (max_of_min - min_of_max) / width
-                    
-                    if separation > max_separation:
-                        max_separation = separation
-                        for i, (mbr, _) in enumerate(entries):
-                            if mbr.min_lon == max_of_min:
-                                seed1_idx = i
-                            if mbr.max_lon == min_of_max:
-                                seed2_idx = i
+                if separation > max_separation:
+                    max_separation = separation
+                    seed1_idx = max_of_min_idx
+                    seed2_idx = min_of_max_idx
         
         # Đảm bảo 2 seeds khác nhau
         if seed1_idx == seed2_idx and len(entries) > 1:
@@ -353,112 +495,126 @@ class RTree:
         half_side_lon = radius_km / (111.0 * math.cos(math.radians(center.lat)))
         
         # Bước 1: Tìm tất cả điểm trong hình vuông
+        square = (center.lat - half_side_lat, center.lat + half_side_lat,
+                  center.lon - half_side_lon, center.lon + half_side_lon)
         candidates = []
-        self._search_square_recursive(
-            self.root, 
-            center.lat, 
-            center.lon,
-            half_side_lat, 
-            half_side_lon, 
-            center,
-            candidates
-        )
-        
-        # Bước 2: Lọc lại chỉ lấy các điểm có khoảng cách <= radius_km
-        results = []
-        for point, distance in candidates:
-            if distance <= radius_km:
-                results.append((point, distance))
+        candidate_coords = []
+        root = self.root
+        if root.mbr and root.mbr.intersects_square(center.lat, center.lon,
+                                                   half_side_lat, half_side_lon):
+            search = self._search_square_leaf if root.is_leaf else self._search_square_internal
+            search(root, square, candidates, candidate_coords)
+        
+        # Bước 2: Tính khoảng cách cho toàn bộ ứng viên một lần và
+        # lọc lại chỉ lấy các điểm có khoảng cách <= radius_km
+        coords = np.concatenate(candidate_coords) if candidate_coords else np.empty((0, 2))
+        if hav_within is not None:
+            distances = np.empty(len(coords))
+            hav_within(center.lat, center.lon, radius_km, coords[:, 0], coords[:, 1], distances)
+            hits = np.nonzero(distances >= 0)[0]
+        else:
+            distances = haversine_distance_np(center.lat, center.lon, coords[:, 0], coords[:, 1])
+            hits = np.nonzero(distances <= radius_km)[0]
         
         # Sắp xếp theo khoảng cách
-        results.sort(key=lambda x: x[1])
-        return results
-    
-    def _search_square_recursive(self, node: RTreeNode, 
-                                 center_lat: float, center_lon: float,
-                                 half_side_lat: float, half_side_lon: float,
-                                 center_point: Point,
-                                 results: List[Tuple[Point, float]]):
-        """Tìm kiếm đệ quy trong R-Tree với hình vuông"""
-        if not node or not node.mbr:
-            return
+        hits = hits[np.argsort(distances[hits], kind='stable')]
+        return [(candidates[i], float(distances[i])) for i in hits]
+    
+    def _search_square_internal(self, node: RTreeNode, square: Tuple[float, float, float, float],
+                                results: List[Point], result_coords: List[np.ndarray]):
+        """
+        Tìm kiếm đệ quy trong node nội bộ với hình vuông.
+        Kiểm tra MBR của tất cả node con cùng lúc và chỉ đi xuống các node con giao với hình vuông.
+        """
+        square_min_lat, square_max_lat, square_min_lon, square_max_lon = square
+        
+        # Giống MBR.intersects_square nhưng cho toàn bộ node con một lần
+        EPSILON = MBR.EPSILON
+        mbrs = node.get_arrays()
+        mask = ~((mbrs[:, 1] < square_min_lat - EPSILON) |  # MBR ở phía dưới square
+                 (mbrs[:, 0] > square_max_lat + EPSILON) |  # MBR ở phía trên square
+                 (mbrs[:, 3] < square_min_lon - EPSILON) |  # MBR ở bên trái square
+                 (mbrs[:, 2] > square_max_lon + EPSILON))   # MBR ở bên phải square
+        
+        for i in np.nonzero(mask)[0]:
+            child_node = node.entries[i][1]
+            search = self._search_square_leaf if child_node.is_leaf else self._search_square_internal
+            search(child_node, square, results, result_coords)
+    
+    def _search_square_leaf(self, node: RTreeNode, square: Tuple[float, float, float, float],
+                            results: List[Point], result_coords: List[np.ndarray]):
+        """
+        Kiểm tra tất cả điểm trong node lá với hình vuông cùng lúc.
+        MBR của node đã được kiểm tra ở node cha.
+        """
+        square_min_lat, square_max_lat, square_min_lon, square_max_lon = square
         
-        # Kiểm tra MBR có giao với hình vuông không
-        if not node.mbr.intersects_square(center_lat, center_lon, 
-                                          half_side_lat, half_side_lon):
-            return
+        coords = node.get_arrays()
+        mask = ((coords[:, 0] >= square_min_lat) & (coords[:, 0] <= square_max_lat) &
+                (coords[:, 1] >= square_min_lon) & (coords[:, 1] <= square_max_lon))
         
-        if node.is_leaf:
-            # Node lá - kiểm tra từng điểm
-            square_min_lat = center_lat - half_side_lat
-            square_max_lat = center_lat + half_side_lat
-            square_min_lon = center_lon - half_side_lon
-            square_max_lon = center_lon + half_side_lon
-            
-            for mbr, point in node.entries:
-                # Kiểm tra điểm có nằm trong hình vuông không
-                if (square_min_lat <= point.lat <= square_max_lat and
-                    square_min_lon <= point.lon <= square_max_lon):
-                    distance = center_point.distance_to(point)
-                    results.append((point, distance))
-        else:
-            # Node nội bộ - tìm kiếm đệ quy
-            for mbr, child_node in node.entries:
-                if child_node is not None:
-                    self._search_square_recursive(
-                        child_node, 
-                        center_lat, 
-                        center_lon,
-                        half_side_lat, 
-                        half_side_lon,
-                        center_point,
-                        results
-                    )
+        hits = np.nonzero(mask)[0]
+        if len(hits):
+            results.extend(node.entries[i][1] for i in hits)
+            result_coords.append(coords[hits])
     
     def count_nodes(self) -> dict:
         """Đếm số lượng node trong cây (để debug)"""
         counts = {'leaf': 0, 'internal': 0, 'total_entries': 0}
-        self._count_recursive(self.root, counts)
+        
+        # Duyệt cây bằng stack thay vì đệ quy
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                counts['leaf'] += 1
+                counts['total_entries'] += len(node.entries)
+            else:
+                counts['internal'] += 1
+                stack.extend(child for _, child in node.entries)
         return counts
     
-    def _count_recursive(self, node: RTreeNode, counts: dict):
-        """Đếm đệ quy"""
-        if node.is_leaf:
-            counts['leaf'] += 1
-            counts['total_entries'] += len(node.entries)
-        else:
-            counts['internal'] += 1
-            for mbr, child in node.entries:
-                self._count_recursive(child, counts)
-    
     def get_height(self) -> int:
         """Lấy chiều cao của cây"""
-        return self._get_height_recursive(self.root)
-    
-    def _get_height_recursive(self, node: RTreeNode) -> int:
-        """Tính chiều cao đệ quy"""
-        if node.is_leaf:
-            return 1
-        if not node.entries:
-            return 1
-        return 1 + max(self._get_height_recursive(child) for _, child in node.entries)
+        # Duyệt theo từng tầng (BFS), chiều cao là số tầng
+        height = 0
+        level = [self.root]
+        while level:
+            height += 1
+            level = [child for node in level if not node.is_leaf for _, child in node.entries]
+        return height
+
+def format_results(results: List[Tuple[Point, float]]):
+    """Sinh chuỗi hiển thị cho từng kết quả tìm kiếm"""
+    for i, (point, distance) in enumerate(results, 1):
+        data = point.data
+        yield (f"{i}. {data['name']} ({data['brand']})\n"
+               f"   Địa chỉ: {data['display_name']}\n"
+               f"   Khoảng cách: {distance:.2f} km\n"
+               f"   Tọa độ: ({point.lat}, {point.lon}) \n\n")
 
 def CreateRTreeFromFile(file_path: str, max_entries: int = 5) -> RTree:
     
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if orjson is not None:
+        with open(file_path, 'rb') as f:
+            data = orjson.loads(f.read())
+    else:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
     
     print(f"Database: {len(data)} gas stations")
     
     rtree = RTree(max_entries=max_entries)
     
-    for item in data:
-        point = Point(
+    points = [
+        Point(
             lat=item['coordinates'][0],
             lon=item['coordinates'][1],
             data=item
         )
-        rtree.insert(point)
+        for item in data
+    ]
+    rtree.bulk_load(points)
     
     # Hiển thị thông tin về cây
     counts = rtree.count_nodes()
@@ -517,11 +673,9 @@ def main():
 
         print(f"Found {len(results)} gas stations in {(end - start)*1000:.3f} ms.")
 
-        for i, (point, distance) in enumerate(results, 1):
-            print(f"{i}. {point.data['name']} ({point.data['brand']})")
-            print(f"   Địa chỉ: {point.data['display_name']}")
-            print(f"   Khoảng cách: {distance:.2f} km")
-            print(f"   Tọa độ: ({point.lat}, {point.lon}) \n")
+        # Ghi toàn bộ kết quả qua stdout (có buffer) thay vì gọi print nhiều lần cho mỗi trạm
+        sys.stdout.writelines(format_results(results))
+        sys.stdout.flush()
 
 
 if __name__ == "__main__":
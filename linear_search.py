@@ -1,30 +1,136 @@
 import math
 import time
 import json
+from collections import defaultdict
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson không bắt buộc, nếu chưa cài thì dùng json chuẩn
+    orjson = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # Numba không bắt buộc, nếu chưa cài thì tính bằng NumPy
+    njit = None
+
+DEG2RAD = math.pi / 180.0
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def scan(lat, lon, lats, lons, cos_lats):
+        """
+        Tính khoảng cách (km) từ (lat, lon) tới các trạm có toạ độ (độ) lats, lons bằng Numba.
+        cos_lats là cos(lat) của các trạm tính sẵn; đổi sang radian gộp vào một phép nhân hằng số,
+        mỗi trạm chỉ còn hai lần gọi sin.
+        """
+        R = 6371.0  # Bán kính Trái đất (km)
+        half = DEG2RAD * 0.5
+        cos_lat = math.cos(lat * DEG2RAD)
+        out = np.empty(lats.size)
+        for i in prange(lats.size):
+            s_lat = math.sin((lats[i] - lat) * half)
+            s_lon = math.sin((lons[i] - lon) * half)
+            a = s_lat * s_lat + cos_lat * cos_lats[i] * s_lon * s_lon
+            out[i] = 2 * R * math.asin(math.sqrt(a))
+        return out
+
+    @njit(fastmath=True, cache=True)
+    def sin_lower_f32(x):
+        """
+        Cận dưới của |sin(x)| bằng đa thức |x| - |x|^3/6 (đúng với mọi |x| <= pi),
+        không gọi libm nên vòng lặp gọi hàm này vector hoá được hoàn toàn.
+        """
+        t = abs(x)
+        if t >= np.float32(1.5):
+            # Góc lớn (bán kính rất lớn): trả về 0 để giữ lại trạm, bước float64 sẽ lọc chính xác
+            return np.float32(0.0)
+        return t - t * t * t * np.float32(1.0 / 6.0)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def prefilter_f32(lat_rad, lon_rad, cos_lat, a_max, lats_rad, lons_rad, cos_lats):
+        """
+        Đánh dấu các trạm có thể nằm trong bán kính, tính Haversine bằng float32
+        (toạ độ radian và cos(lat) của các trạm là mảng float32 tính sẵn).
+        Dùng cận dưới của sin nên a tính được không lớn hơn giá trị thật, không bỏ sót trạm.
+        """
+        half = np.float32(0.5)
+        out = np.empty(lats_rad.size, dtype=np.bool_)
+        for i in prange(lats_rad.size):
+            s_lat = sin_lower_f32((lats_rad[i] - lat_rad) * half)
+            s_lon = sin_lower_f32((lons_rad[i] - lon_rad) * half)
+            out[i] = s_lat * s_lat + cos_lat * cos_lats[i] * s_lon * s_lon <= a_max
+        return out
+else:
+    scan = None
+    prefilter_f32 = None
+
+def distance_km_np(lat, lon, lats_rad, lons_rad, cos_lats):
+    """
+    Tính khoảng cách (km) từ (lat, lon) tới toàn bộ các trạm bằng NumPy.
+    lats_rad, lons_rad, cos_lats là toạ độ (radian) và cos(lat) của các trạm, tính sẵn một lần.
+    """
+    R = 6371.0  # Bán kính Trái đất (km)
 
-def distance_km(lat1, lon1, lat2, lon2):
+    lat_rad = math.radians(lat)
+    lon_rad = math.radians(lon)
+
+    # Công thức Haversine trên cả mảng
+    a = np.sin((lats_rad - lat_rad) / 2)**2 + math.cos(lat_rad) * cos_lats * np.sin((lons_rad - lon_rad) / 2)**2
+    return 2 * R * np.arcsin(np.sqrt(a))
+
+def bounding_box_deg(lat, r):
     """
-    Tính khoảng cách giữa hai tọa độ (lat1, lon1) và (lat2, lon2) theo km.
+    Nửa cạnh (độ) theo lat và lon của hình chữ nhật bao hình tròn bán kính r (km) quanh vĩ độ lat.
+    Mọi điểm có khoảng cách Haversine <= r đều nằm trong hình chữ nhật này.
     """
     R = 6371.0  # Bán kính Trái đất (km)
+    margin = 1 + 1e-9  # Nới rộng một chút cho sai số làm tròn
 
-    # Chuyển độ sang radian
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
+    dlat_max = math.degrees(r / R) * margin
 
-    # Hiệu giữa các toạ độ
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
+    # cos(lat) nhỏ nhất trong dải vĩ độ của hình tròn (càng xa xích đạo, 1 độ lon càng ngắn)
+    cos_far = math.cos(math.radians(min(abs(lat) + dlat_max, 90.0)))
+    s = math.sin(min(r / (2 * R), math.pi / 2))
+    if s >= cos_far:
+        # Hình tròn phủ hết mọi kinh độ
+        return dlat_max, math.inf
+    return dlat_max, math.degrees(2 * math.asin(s / cos_far)) * margin
 
-    # Công thức Haversine
-    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
-    distance = R * c
-    return distance
+def build_grid(lats_deg, lons_deg):
+    """
+    Chia các trạm vào lưới ô 1 độ x 1 độ: (floor(lat), floor(lon)) -> mảng index các trạm trong ô.
+    """
+    grid = defaultdict(list)
+    for i, (lat, lon) in enumerate(zip(np.floor(lats_deg).astype(np.int64).tolist(),
+                                       np.floor(lons_deg).astype(np.int64).tolist())):
+        grid[(lat, lon)].append(i)
+    return {cell: np.array(ids, dtype=np.intp) for cell, ids in grid.items()}
 
+def grid_candidates(grid, lat, lon, dlat_max, dlon_max):
+    """
+    Index (tăng dần) các trạm thuộc những ô lưới giao với hình chữ nhật
+    [lat - dlat_max, lat + dlat_max] x [lon - dlon_max, lon + dlon_max].
+    """
+    lat_lo, lat_hi = math.floor(lat - dlat_max), math.floor(lat + dlat_max)
+    if math.isinf(dlon_max):
+        lon_lo, lon_hi = -math.inf, math.inf
+    else:
+        lon_lo, lon_hi = math.floor(lon - dlon_max), math.floor(lon + dlon_max)
+
+    if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) <= len(grid):
+        # Hình chữ nhật nhỏ: tra trực tiếp từng ô
+        parts = [grid[cell] for cell in ((i, j) for i in range(lat_lo, lat_hi + 1)
+                                         for j in range(lon_lo, lon_hi + 1)) if cell in grid]
+    else:
+        # Hình chữ nhật phủ nhiều ô hơn số ô có trạm: duyệt các ô có trạm
+        parts = [ids for (i, j), ids in grid.items() if lat_lo <= i <= lat_hi and lon_lo <= j <= lon_hi]
+
+    if not parts:
+        return np.empty(0, dtype=np.intp)
+    # Sắp xếp lại theo index để thứ tự các trạm cùng khoảng cách không đổi
+    return np.sort(np.concatenate(parts))
 
 
 def main():
@@ -38,28 +144,61 @@ def main():
     if args.file is not None:
         file = args.file
 
-    f = open(file, "r", encoding="utf-8")
-
-
-    data = json.load(f)
+    if orjson is not None:
+        with open(file, "rb") as f:
+            data = orjson.loads(f.read())
+    else:
+        with open(file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+    # Toạ độ các trạm (độ và radian) và cos(lat) không đổi giữa các lần tìm kiếm nên tính trước
+    # data chỉ còn dùng để hiển thị, tra theo index
+    lats_deg = np.fromiter((station["coordinates"][0] for station in data), dtype=np.float64, count=len(data))
+    lons_deg = np.fromiter((station["coordinates"][1] for station in data), dtype=np.float64, count=len(data))
+    lats_rad = np.radians(lats_deg)
+    lons_rad = np.radians(lons_deg)
+    cos_lats = np.cos(lats_rad)
+
+    # Bản float32 cho bước lọc bằng Numba (gấp đôi số phần tử mỗi lệnh SIMD)
+    lats_rad32 = lats_rad.astype(np.float32)
+    lons_rad32 = lons_rad.astype(np.float32)
+    cos_lats32 = cos_lats.astype(np.float32)
+
+    # Lưới ô 1 độ để chỉ xét các trạm ở những ô gần điểm cần tìm
+    grid = build_grid(lats_deg, lons_deg)
 
     while True:
         print("="*80)
         lat = float(input("lat = "))
         lon = float(input("lon = "))
         r = float(input("r = "))
-        result = []
 
         start = time.perf_counter()
 
-        for station in data:
-            distance = distance_km(lat, lon, station["coordinates"][0], station["coordinates"][1])
-            if(distance <= r):
-                result.append((station, distance))
+        # Lọc thô: lấy các trạm trong những ô lưới giao với hình chữ nhật bao hình tròn,
+        # so sánh độ với hình chữ nhật, rồi mới tính Haversine
+        dlat_max, dlon_max = bounding_box_deg(lat, r)
+        cand = grid_candidates(grid, lat, lon, dlat_max, dlon_max)
+        cand = cand[(np.abs(lats_deg[cand] - lat) <= dlat_max) & (np.abs(lons_deg[cand] - lon) <= dlon_max)]
+
+        if scan is not None:
+            # Lọc tiếp bằng float32 với bán kính nới rộng (0.01% + 10 m, lớn hơn nhiều so với sai số float32),
+            # các trạm còn lại tính lại chính xác bằng float64
+            r_loose = r * (1 + 1e-4) + 0.01
+            a_max = np.float32(math.sin(min(r_loose / (2 * 6371.0), math.pi / 2))**2)
+            lat_rad = math.radians(lat)
+            keep = prefilter_f32(np.float32(lat_rad), np.float32(math.radians(lon)), np.float32(math.cos(lat_rad)),
+                                 a_max, lats_rad32[cand], lons_rad32[cand], cos_lats32[cand])
+            cand = cand[keep]
+            distances = scan(lat, lon, lats_deg[cand], lons_deg[cand], cos_lats[cand])
+        else:
+            distances = distance_km_np(lat, lon, lats_rad[cand], lons_rad[cand], cos_lats[cand])
+        idx = np.nonzero(distances <= r)[0]
 
         
         #sort result by distance
-        result.sort(key=lambda x: x[1])
+        idx = idx[np.argsort(distances[idx], kind='stable')]
+        result = [(data[cand[i]], float(distances[i])) for i in idx]
 
 
         
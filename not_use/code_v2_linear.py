@@ -1,32 +1,141 @@
 import json
 import math
+import heapq
+import itertools
 from typing import List, Tuple, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import time
+import numpy as np
 
-@dataclass
+try:
+    import orjson
+except ImportError:  # orjson không bắt buộc, nếu chưa cài thì dùng json chuẩn
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # Numba không bắt buộc, nếu chưa cài thì tìm kiếm trên các node object
+    njit = None
+
+@dataclass(slots=True)
 class Point:
     """Đại diện cho một điểm trên bản đồ"""
     lat: float
     lon: float
     data: dict
+    # Toạ độ radian và cos(lat) tính sẵn một lần khi tạo điểm (toạ độ không đổi)
+    lat_rad: float = field(init=False, repr=False, compare=False)
+    lon_rad: float = field(init=False, repr=False, compare=False)
+    cos_lat: float = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self.lat_rad = math.radians(self.lat)
+        self.lon_rad = math.radians(self.lon)
+        self.cos_lat = math.cos(self.lat_rad)
     
     def distance_to(self, other: 'Point') -> float:
         """Tính khoảng cách Haversine giữa 2 điểm (km)"""
         R = 6371  # Bán kính trái đất (km)
         
-        lat1, lon1 = math.radians(self.lat), math.radians(self.lon)
-        lat2, lon2 = math.radians(other.lat), math.radians(other.lon)
-        
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+        dlat = other.lat_rad - self.lat_rad
+        dlon = other.lon_rad - self.lon_rad
         
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+        a = math.sin(dlat/2)**2 + self.cos_lat * other.cos_lat * math.sin(dlon/2)**2
         c = 2 * math.asin(math.sqrt(a))
         
         return R * c
 
-@dataclass
+def min_distance_r(mbr_r: Tuple[float, float, float, float],
+                   clat_r: float, clon_r: float, cos_clat: float) -> float:
+    """
+    Khoảng cách Haversine (km) từ tâm tới điểm gần nhất trong MBR.
+    MBR là tuple radian (min_lat, max_lat, min_lon, max_lon), tâm cho bằng radian và cos(lat) tính sẵn.
+    """
+    R = 6371  # Bán kính trái đất (km)
+    
+    min_lat_r, max_lat_r, min_lon_r, max_lon_r = mbr_r
+    
+    # Điểm gần nhất trong MBR đến tâm
+    lat_r = max(min_lat_r, min(clat_r, max_lat_r))
+    lon_r = max(min_lon_r, min(clon_r, max_lon_r))
+    
+    dlat = lat_r - clat_r
+    dlon = lon_r - clon_r
+    if dlat == 0 and dlon == 0:
+        # Tâm nằm trong MBR
+        return 0.0
+    
+    a = math.sin(dlat/2)**2 + cos_clat * math.cos(lat_r) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    
+    return R * c
+
+def haversine_distance_r_np(clat_r: float, clon_r: float, cos_clat: float, coords: np.ndarray) -> np.ndarray:
+    """
+    Khoảng cách Haversine (km) từ tâm tới mảng các điểm bằng NumPy.
+    coords có dạng (k, 3) [lat_rad, lon_rad, cos_lat], tâm cho bằng radian và cos(lat) tính sẵn.
+    """
+    R = 6371  # Bán kính trái đất (km)
+    
+    dlat = coords[:, 0] - clat_r
+    dlon = coords[:, 1] - clon_r
+    
+    a = np.sin(dlat/2)**2 + cos_clat * coords[:, 2] * np.sin(dlon/2)**2
+    
+    return R * (2 * np.arcsin(np.sqrt(a)))
+
+def intersects_circle_r(mbr_r: Tuple[float, float, float, float],
+                        clat_r: float, clon_r: float, cos_clat: float, radius_km: float) -> bool:
+    """Kiểm tra MBR (tuple radian) có giao với hình tròn tâm (clat_r, clon_r) bán kính radius_km không"""
+    return min_distance_r(mbr_r, clat_r, clon_r, cos_clat) <= radius_km
+
+if njit is not None:
+    @njit(cache=True)
+    def flat_search(node_mbr, first_child, n_children, is_leaf, num_points,
+                    clat_r, clon_r, cos_clat, radius_km):
+        """
+        Duyệt cây đã làm phẳng (xem RTree.flatten) theo chiều sâu bằng stack là mảng index,
+        trả về index các điểm thuộc những node lá có MBR giao với hình tròn (theo thứ tự duyệt).
+        """
+        R = 6371.0  # Bán kính trái đất (km)
+        
+        # Mỗi node được đưa vào stack nhiều nhất một lần nên stack không vượt quá số node
+        stack = np.empty(node_mbr.shape[0], dtype=np.int64)
+        out = np.empty(num_points, dtype=np.int64)
+        stack[0] = 0
+        sp = 1
+        k = 0
+        while sp > 0:
+            sp -= 1
+            i = stack[sp]
+            if n_children[i] == 0:
+                continue
+            
+            # Khoảng cách từ tâm tới điểm gần nhất trong MBR (như min_distance_r)
+            lat_r = max(node_mbr[i, 0], min(clat_r, node_mbr[i, 1]))
+            lon_r = max(node_mbr[i, 2], min(clon_r, node_mbr[i, 3]))
+            dlat = lat_r - clat_r
+            dlon = lon_r - clon_r
+            if dlat != 0 or dlon != 0:
+                a = math.sin(dlat/2)**2 + cos_clat * math.cos(lat_r) * math.sin(dlon/2)**2
+                if R * (2 * math.asin(math.sqrt(a))) > radius_km:
+                    continue
+            
+            first = first_child[i]
+            if is_leaf[i]:
+                for j in range(first, first + n_children[i]):
+                    out[k] = j
+                    k += 1
+            else:
+                # Đưa các node con vào stack theo thứ tự ngược để giữ thứ tự duyệt như search
+                for c in range(n_children[i] - 1, -1, -1):
+                    stack[sp] = first + c
+                    sp += 1
+        return out[:k]
+else:
+    flat_search = None
+
+@dataclass(slots=True)
 class MBR:
     """Minimum Bounding Rectangle"""
     min_lat: float
@@ -45,18 +154,16 @@ class MBR:
     
     def intersects_circle(self, center: Point, radius_km: float) -> bool:
         """Kiểm tra MBR có giao với hình tròn không"""
-        # Kiểm tra nếu center nằm trong MBR
-        if self.contains_point(center):
-            return True
-        
-        # Tìm điểm gần nhất trong MBR đến center
-        closest_lat = max(self.min_lat, min(center.lat, self.max_lat))
-        closest_lon = max(self.min_lon, min(center.lon, self.max_lon))
-        
-        closest_point = Point(closest_lat, closest_lon, {})
-        distance = center.distance_to(closest_point)
-        
-        return distance <= radius_km
+        return self.min_distance(center) <= radius_km
+    
+    def min_distance(self, center: Point) -> float:
+        """Khoảng cách (km) từ center tới điểm gần nhất trong MBR"""
+        return min_distance_r(self.to_radians(), center.lat_rad, center.lon_rad, center.cos_lat)
+    
+    def to_radians(self) -> Tuple[float, float, float, float]:
+        """MBR dạng tuple radian (min_lat, max_lat, min_lon, max_lon)"""
+        return (math.radians(self.min_lat), math.radians(self.max_lat),
+                math.radians(self.min_lon), math.radians(self.max_lon))
     
     def expand_to_include(self, point: Point) -> 'MBR':
         """Mở rộng MBR để bao gồm điểm mới"""
@@ -93,11 +200,24 @@ class MBR:
 
 class RTreeNode:
     """Node trong R-Tree"""
+    __slots__ = ('is_leaf', 'mbr', 'mbr_r', 'entries', 'parent', 'coords')
+    
     def __init__(self, is_leaf: bool = True, parent=None):
         self.is_leaf = is_leaf
         self.mbr: Optional[MBR] = None
+        # MBR dạng tuple radian, tính lại cùng mbr, dùng khi tìm kiếm để không phải đổi đơn vị
+        self.mbr_r: Optional[Tuple[float, float, float, float]] = None
         self.entries: List[Tuple[MBR, any]] = []  # (MBR, Point hoặc RTreeNode)
         self.parent = parent
+        # Node lá: toạ độ các điểm dạng mảng (k, 3) [lat_rad, lon_rad, cos_lat], tạo lại khi entries thay đổi
+        self.coords: Optional[np.ndarray] = None
+    
+    def get_coords(self) -> np.ndarray:
+        """Mảng toạ độ các điểm của node lá (tạo lại nếu entries đã thay đổi)"""
+        if self.coords is None:
+            self.coords = np.array([(p.lat_rad, p.lon_rad, p.cos_lat) for _, p in self.entries],
+                                   dtype=np.float64).reshape(-1, 3)
+        return self.coords
     
     def is_full(self, max_entries: int) -> bool:
         """Kiểm tra node đã đầy chưa"""
@@ -105,14 +225,28 @@ class RTreeNode:
     
     def update_mbr(self):
         """Cập nhật MBR của node"""
+        self.coords = None
         if not self.entries:
             self.mbr = None
+            self.mbr_r = None
             return
         
-        mbr = self.entries[0][0]
+        # Tính min/max vào biến cục bộ, chỉ tạo một MBR ở cuối
+        first_mbr = self.entries[0][0]
+        min_lat, max_lat = first_mbr.min_lat, first_mbr.max_lat
+        min_lon, max_lon = first_mbr.min_lon, first_mbr.max_lon
         for entry_mbr, _ in self.entries[1:]:
-            mbr = mbr.expand_to_include_mbr(entry_mbr)
+            if entry_mbr.min_lat < min_lat:
+                min_lat = entry_mbr.min_lat
+            if entry_mbr.max_lat > max_lat:
+                max_lat = entry_mbr.max_lat
+            if entry_mbr.min_lon < min_lon:
+                min_lon = entry_mbr.min_lon
+            if entry_mbr.max_lon > max_lon:
+                max_lon = entry_mbr.max_lon
+        mbr = MBR(min_lat, max_lat, min_lon, max_lon)
         self.mbr = mbr
+        self.mbr_r = mbr.to_radians()
 
 class RTree:
     """R-Tree implementation với Linear Split Algorithm"""
@@ -120,9 +254,12 @@ class RTree:
         self.max_entries = max_entries
         self.min_entries = max(2, max_entries // 2)
         self.root = RTreeNode(is_leaf=True)
+        # Cây dạng mảng cho search_flat, tạo bởi flatten() và huỷ khi cây thay đổi
+        self.flat = None
     
     def insert(self, point: Point):
         """Chèn một điểm vào R-Tree"""
+        self.flat = None
         mbr = MBR.from_point(point)
         
         # Tìm node lá phù hợp
@@ -136,27 +273,73 @@ class RTree:
         if len(leaf.entries) > self.max_entries:
             self._handle_overflow(leaf)
     
+    def bulk_load(self, points: List[Point]):
+        """
+        Xây dựng lại toàn bộ R-Tree từ danh sách điểm bằng Sort-Tile-Recursive (STR).
+        
+        Dùng khi đã biết trước toàn bộ dữ liệu: nhanh hơn nhiều so với insert từng điểm
+        và các node ít chồng lấn hơn. Sau khi bulk load vẫn có thể insert thêm điểm.
+        """
+        # Tầng lá
+        nodes = self._str_pack([(MBR.from_point(p), p) for p in points], is_leaf=True)
+        
+        # Gom dần các node thành tầng nội bộ cho tới khi chỉ còn 1 node (root)
+        while len(nodes) > 1:
+            nodes = self._str_pack([(node.mbr, node) for node in nodes], is_leaf=False)
+        
+        self.root = nodes[0] if nodes else RTreeNode(is_leaf=True)
+        self.root.parent = None
+        self.flat = None
+    
+    def _str_pack(self, entries: List[Tuple[MBR, any]], is_leaf: bool) -> List[RTreeNode]:
+        """Đóng gói các entry thành các node (tối đa max_entries entry/node) theo STR"""
+        if not entries:
+            return []
+        
+        M = self.max_entries
+        num_nodes = math.ceil(len(entries) / M)
+        num_slices = math.ceil(math.sqrt(num_nodes))
+        slice_size = num_slices * M
+        
+        # Sắp xếp theo tâm lat, chia thành các lát (slice)
+        entries = sorted(entries, key=lambda e: e[0].min_lat + e[0].max_lat)
+        
+        nodes = []
+        for i in range(0, len(entries), slice_size):
+            # Trong mỗi lát, sắp xếp theo tâm lon rồi cắt thành các node
+            slice_entries = sorted(entries[i:i + slice_size], key=lambda e: e[0].min_lon + e[0].max_lon)
+            for j in range(0, len(slice_entries), M):
+                node = RTreeNode(is_leaf=is_leaf)
+                node.entries = slice_entries[j:j + M]
+                if not is_leaf:
+                    for _, child in node.entries:
+                        child.parent = node
+                node.update_mbr()
+                nodes.append(node)
+        
+        return nodes
+    
     def _choose_leaf(self, node: RTreeNode, mbr: MBR) -> RTreeNode:
         """Chọn node lá phù hợp để chèn"""
-        if node.is_leaf:
-            return node
-        
-        # Tìm entry có sự mở rộng diện tích nhỏ nhất
-        best_entry = None
-        min_enlargement = float('inf')
-        min_area = float('inf')
-        
-        for entry_mbr, child_node in node.entries:
-            enlarged_mbr = entry_mbr.expand_to_include_mbr(mbr)
-            enlargement = enlarged_mbr.area() - entry_mbr.area()
+        while not node.is_leaf:
+            # Tìm entry có sự mở rộng diện tích nhỏ nhất
+            best_entry = None
+            min_enlargement = float('inf')
+            min_area = float('inf')
+            
+            for entry_mbr, child_node in node.entries:
+                enlarged_mbr = entry_mbr.expand_to_include_mbr(mbr)
+                enlargement = enlarged_mbr.area() - entry_mbr.area()
+                
+                # Chọn theo enlargement nhỏ nhất, nếu bằng thì chọn theo area nhỏ nhất
+                if enlargement < min_enlargement or (enlargement == min_enlargement and entry_mbr.area() < min_area):
+                    min_enlargement = enlargement
+                    min_area = entry_mbr.area()
+                    best_entry = child_node
             
-            # Chọn theo enlargement nhỏ nhất, nếu bằng thì chọn theo area nhỏ nhất
-            if enlargement < min_enlargement or (enlargement == min_enlargement and entry_mbr.area() < min_area):
-                min_enlargement = enlargement
-                min_area = entry_mbr.area()
-                best_entry = child_node
+            node = best_entry
         
-        return self._choose_leaf(best_entry, mbr)
+        return node
     
     def _handle_overflow(self, node: RTreeNode):
         """Xử lý overflow khi node đầy"""
@@ -214,19 +397,25 @@ class RTree:
         remaining = [e for i, e in enumerate(node.entries) 
                     if i != seed1_idx and i != seed2_idx]
         
+        # MBR và diện tích hiện tại của 2 node, được mở rộng dần khi thêm entry
+        # (không cần quét lại toàn bộ entries bằng update_mbr sau mỗi lần thêm)
+        mbr1 = node1.entries[0][0]
+        mbr2 = node2.entries[0][0]
+        area1 = mbr1.area()
+        area2 = mbr2.area()
+        
         for entry in remaining:
             mbr, data = entry
             
-            # Cập nhật MBR trước khi tính toán
-            node1.update_mbr()
-            node2.update_mbr()
-            
             # Tính enlargement cho mỗi node
-            enlarged1 = node1.mbr.expand_to_include_mbr(mbr)
-            enlarged2 = node2.mbr.expand_to_include_mbr(mbr)
+            enlarged1 = mbr1.expand_to_include_mbr(mbr)
+            enlarged2 = mbr2.expand_to_include_mbr(mbr)
+            
+            enlarged_area1 = enlarged1.area()
+            enlarged_area2 = enlarged2.area()
             
-            enlargement1 = enlarged1.area() - node1.mbr.area()
-            enlargement2 = enlarged2.area() - node2.mbr.area()
+            enlargement1 = enlarged_area1 - area1
+            enlargement2 = enlarged_area2 - area2
             
             # Chọn node để thêm entry
             if enlargement1 < enlargement2:
@@ -235,9 +424,9 @@ class RTree:
                 target_node = node2
             else:
                 # Nếu enlargement bằng nhau, chọn node có diện tích nhỏ hơn
-                if node1.mbr.area() < node2.mbr.area():
+                if area1 < area2:
                     target_node = node1
-                elif node2.mbr.area() < node1.mbr.area():
+                elif area2 < area1:
                     target_node = node2
                 else:
                     # Nếu diện tích cũng bằng nhau, chọn node có ít entries hơn
@@ -245,64 +434,68 @@ class RTree:
             
             target_node.entries.append(entry)
             
+            # Chỉ cập nhật MBR của node vừa được thêm entry
+            if target_node is node1:
+                mbr1, area1 = enlarged1, enlarged_area1
+            else:
+                mbr2, area2 = enlarged2, enlarged_area2
+            
             # Cập nhật parent pointer nếu không phải leaf
             if not node.is_leaf:
                 data.parent = target_node
         
-        # Cập nhật MBR cuối cùng
-        node1.update_mbr()
-        node2.update_mbr()
+        node1.mbr, node1.mbr_r = mbr1, mbr1.to_radians()
+        node2.mbr, node2.mbr_r = mbr2, mbr2.to_radians()
         
         return node1, node2
     
     def _linear_pick_seeds(self, entries: List[Tuple[MBR, any]]) -> Tuple[int, int]:
         """Linear Pick Seeds Algorithm - chọn 2 entry xa nhau nhất"""
+        # Duyệt entries một lần, tính đồng thời cho cả 2 chiều:
+        # min của max, max của min (kèm index, lấy index cuối cùng khi bằng nhau)
+        # và min/max tổng thể để chuẩn hoá
+        first = entries[0][0]
+        min_max_lat, max_min_lat = first.max_lat, first.min_lat
+        min_max_lon, max_min_lon = first.max_lon, first.min_lon
+        min_max_lat_idx = max_min_lat_idx = min_max_lon_idx = max_min_lon_idx = 0
+        overall_min_lat, overall_max_lat = first.min_lat, first.max_lat
+        overall_min_lon, overall_max_lon = first.min_lon, first.max_lon
+        
+        for i, (mbr, _) in enumerate(entries):
+            if mbr.max_lat <= min_max_lat:
+                min_max_lat, min_max_lat_idx = mbr.max_lat, i
+            if mbr.min_lat >= max_min_lat:
+                max_min_lat, max_min_lat_idx = mbr.min_lat, i
+            if mbr.max_lon <= min_max_lon:
+                min_max_lon, min_max_lon_idx = mbr.max_lon, i
+            if mbr.min_lon >= max_min_lon:
+                max_min_lon, max_min_lon_idx = mbr.min_lon, i
+            if mbr.min_lat < overall_min_lat:
+                overall_min_lat = mbr.min_lat
+            if mbr.max_lat > overall_max_lat:
+                overall_max_lat = mbr.max_lat
+            if mbr.min_lon < overall_min_lon:
+                overall_min_lon = mbr.min_lon
+            if mbr.max_lon > overall_max_lon:
+                overall_max_lon = mbr.max_lon
+        
         max_separation = -float('inf')
         seed1_idx = 0
         seed2_idx = 1 if len(entries) > 1 else 0
         
-        # Tìm cặp có separation lớn nhất theo từng chiều
-        for dim in ['lat', 'lon']:
-            if dim == 'lat':
-                # Tìm min của max_lat và max của min_lat
-                min_of_max = min(mbr.max_lat for mbr, _ in entries)
-                max_of_min = max(mbr.min_lat for mbr, _ in entries)
-                
-                # Tính width tổng thể
-                overall_min = min(mbr.min_lat for mbr, _ in entries)
-                overall_max = max(mbr.max_lat for mbr, _ in entries)
-                width = overall_max - overall_min
-                
-                if width > 0:
-                    # Tính normalized separation
-                    separation = (max_of_min - min_of_max) / width
-                    
-                    if separation > max_separation:
-                        max_separation = separation
-                        # Tìm index của entry có max_of_min và min_of_max
-                        for i, (mbr, _) in enumerate(entries):
-                            if mbr.min_lat == max_of_min:
-                                seed1_idx = i
-                            if mbr.max_lat == min_of_max:
-                                seed2_idx = i
-            else:  # lon
-                min_of_max = min(mbr.max_lon for mbr, _ in entries)
-                max_of_min = max(mbr.min_lon for mbr, _ in entries)
-                
-                overall_min = min(mbr.min_lon for mbr, _ in entries)
-                overall_max = max(mbr.max_lon for mbr, _ in entries)
-                width = overall_max - overall_min
+        # Chọn chiều có normalized separation lớn nhất
+        for max_of_min, max_of_min_idx, min_of_max, min_of_max_idx, width in (
+                (max_min_lat, max_min_lat_idx, min_max_lat, min_max_lat_idx,
+                 overall_max_lat - overall_min_lat),
+                (max_min_lon, max_min_lon_idx, min_max_lon, min_max_lon_idx,
+                 overall_max_lon - overall_min_lon)):
+            if width > 0:
+                separation = (max_of_min - min_of_max) / width
                 
-                if width > 0:
-                    separation = (max_of_min - min_of_max) / width
-                    
-                    if separation > max_separation:
-                        max_separation = separation
-                        for i, (mbr, _) in enumerate(entries):
-                            if mbr.min_lon == max_of_min:
-                                seed1_idx = i
-                            if mbr.max_lon == min_of_max:
-                                seed2_idx = i
+                if separation > max_separation:
+                    max_separation = separation
+                    seed1_idx = max_of_min_idx
+                    seed2_idx = min_of_max_idx
         
         # Đảm bảo 2 seeds khác nhau
         if seed1_idx == seed2_idx and len(entries) > 1:
@@ -312,34 +505,131 @@ class RTree:
     
     def search(self, center: Point, radius_km: float) -> List[Tuple[Point, float]]:
         """Tìm kiếm các điểm trong bán kính r từ center"""
-        results = []
-        self._search_recursive(self.root, center, radius_km, results)
+        points = []
+        coords = []
+        clat_r, clon_r, cos_clat = center.lat_rad, center.lon_rad, center.cos_lat
+        
+        # Duyệt theo chiều sâu bằng stack thay vì đệ quy
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not node or not node.mbr:
+                continue
+            
+            # Kiểm tra MBR có giao với hình tròn không
+            if not intersects_circle_r(node.mbr_r, clat_r, clon_r, cos_clat, radius_km):
+                continue
+            
+            if node.is_leaf:
+                # Node lá - gom các điểm, khoảng cách tính một lần cho tất cả ở cuối
+                points.extend(point for _, point in node.entries)
+                coords.append(node.get_coords())
+            else:
+                # Node nội bộ - đưa các node con vào stack (đảo ngược để giữ thứ tự duyệt)
+                stack.extend(child_node for _, child_node in reversed(node.entries))
         
-        # Sắp xếp theo khoảng cách
-        results.sort(key=lambda x: x[1])
-        return results
+        return self._filter_by_distance(center, radius_km, points, coords)
     
-    def _search_recursive(self, node: RTreeNode, center: Point, 
-                         radius_km: float, results: List[Tuple[Point, float]]):
-        """Tìm kiếm đệ quy trong R-Tree"""
-        if not node or not node.mbr:
-            return
-        
-        # Kiểm tra MBR có giao với hình tròn không
-        if not node.mbr.intersects_circle(center, radius_km):
-            return
+    def search_bf(self, center: Point, radius_km: float) -> List[Tuple[Point, float]]:
+        """
+        Tìm kiếm Best-First: lấy các node ra theo thứ tự khoảng cách nhỏ nhất từ center
+        tới MBR (hàng đợi ưu tiên), dừng ngay khi khoảng cách này vượt quá bán kính.
+        """
+        points = []
+        coords = []
+        if not self.root.mbr:
+            return []
+        
+        counter = itertools.count()  # Phân định thứ tự khi 2 node cùng khoảng cách
+        clat_r, clon_r, cos_clat = center.lat_rad, center.lon_rad, center.cos_lat
+        heap = [(min_distance_r(self.root.mbr_r, clat_r, clon_r, cos_clat), next(counter), self.root)]
+        
+        while heap:
+            min_dist, _, node = heapq.heappop(heap)
+            if min_dist > radius_km:
+                # Các node còn lại trong heap đều xa hơn
+                break
+            
+            if node.is_leaf:
+                # Gom các điểm, khoảng cách tính một lần cho tất cả ở cuối
+                points.extend(point for _, point in node.entries)
+                coords.append(node.get_coords())
+            else:
+                # Mọi node con đều vào heap, node ngoài bán kính bị loại khi lấy ra ở trên
+                for _, child_node in node.entries:
+                    if child_node is not None and child_node.mbr:
+                        heapq.heappush(heap, (min_distance_r(child_node.mbr_r, clat_r, clon_r, cos_clat),
+                                              next(counter), child_node))
         
-        if node.is_leaf:
-            # Node lá - kiểm tra từng điểm
-            for mbr, point in node.entries:
-                distance = center.distance_to(point)
-                if distance <= radius_km:
-                    results.append((point, distance))
-        else:
-            # Node nội bộ - tìm kiếm đệ quy
-            for mbr, child_node in node.entries:
-                if child_node is not None:
-                    self._search_recursive(child_node, center, radius_km, results)
+        return self._filter_by_distance(center, radius_km, points, coords)
+    
+    def flatten(self):
+        """
+        Làm phẳng cây thành các mảng liên tục (kiểu CSR), đánh số node theo BFS nên các node con
+        của một node nằm liền nhau:
+        node_mbr[i] là MBR radian, node lá i chứa các điểm first_child[i] .. first_child[i] + n_children[i] - 1,
+        node nội bộ i có các node con first_child[i] .. first_child[i] + n_children[i] - 1.
+        """
+        nodes = [self.root]
+        node_mbr = []
+        first_child = []
+        n_children = []
+        is_leaf = []
+        points = []
+        
+        i = 0
+        while i < len(nodes):
+            node = nodes[i]
+            i += 1
+            node_mbr.append(node.mbr_r if node.mbr else (0.0, 0.0, 0.0, 0.0))
+            is_leaf.append(node.is_leaf)
+            n_children.append(len(node.entries))
+            if node.is_leaf:
+                first_child.append(len(points))
+                points.extend(point for _, point in node.entries)
+            else:
+                first_child.append(len(nodes))
+                nodes.extend(child_node for _, child_node in node.entries)
+        
+        self.flat = (
+            np.array(node_mbr, dtype=np.float64).reshape(-1, 4),
+            np.array(first_child, dtype=np.int64),
+            np.array(n_children, dtype=np.int64),
+            np.array(is_leaf, dtype=np.bool_),
+            points,
+            np.array([(p.lat_rad, p.lon_rad, p.cos_lat) for p in points], dtype=np.float64).reshape(-1, 3),
+        )
+        return self.flat
+    
+    def search_flat(self, center: Point, radius_km: float) -> List[Tuple[Point, float]]:
+        """
+        Tìm kiếm trên cây đã làm phẳng bằng Numba (kết quả giống search).
+        Nếu chưa cài Numba thì dùng search_bf.
+        """
+        if flat_search is None:
+            return self.search_bf(center, radius_km)
+        
+        if self.flat is None:
+            self.flatten()
+        node_mbr, first_child, n_children, is_leaf, points, coords = self.flat
+        
+        cand = flat_search(node_mbr, first_child, n_children, is_leaf, len(points),
+                           center.lat_rad, center.lon_rad, center.cos_lat, radius_km)
+        distances = haversine_distance_r_np(center.lat_rad, center.lon_rad, center.cos_lat, coords[cand])
+        
+        hits = np.nonzero(distances <= radius_km)[0]
+        hits = hits[np.argsort(distances[hits], kind='stable')]
+        return [(points[cand[i]], float(distances[i])) for i in hits]
+    
+    def _filter_by_distance(self, center: Point, radius_km: float, points: List[Point],
+                            coords: List[np.ndarray]) -> List[Tuple[Point, float]]:
+        """Tính khoảng cách cho các điểm gom từ node lá, giữ các điểm trong bán kính và sắp xếp theo khoảng cách"""
+        coords = np.concatenate(coords) if coords else np.empty((0, 3))
+        distances = haversine_distance_r_np(center.lat_rad, center.lon_rad, center.cos_lat, coords)
+        
+        hits = np.nonzero(distances <= radius_km)[0]
+        hits = hits[np.argsort(distances[hits], kind='stable')]
+        return [(points[i], float(distances[i])) for i in hits]
     
     def count_nodes(self) -> dict:
         """Đếm số lượng node trong cây (để debug)"""
@@ -389,8 +679,12 @@ def main():
     
     # Đọc dữ liệu
     print(f"Đang đọc dữ liệu từ {args.file}...")
-    with open(args.file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if orjson is not None:
+        with open(args.file, 'rb') as f:
+            data = orjson.loads(f.read())
+    else:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
     
     print(f"Đã đọc {len(data)} trạm xăng")
     
@@ -398,13 +692,15 @@ def main():
     print(f"Đang tạo R-Tree với max_entries = {args.max_entries}...")
     rtree = RTree(max_entries=args.max_entries)
     
-    for item in data:
-        point = Point(
+    points = [
+        Point(
             lat=item['coordinates'][0],
             lon=item['coordinates'][1],
             data=item
         )
-        rtree.insert(point)
+        for item in data
+    ]
+    rtree.bulk_load(points)
     
     print("Đã tạo R-Tree thành công!")
     
@@ -423,7 +719,7 @@ def main():
               f"trong bán kính {args.radius} km...")
         
         search_point = Point(args.lat, args.lon, {})
-        results = rtree.search(search_point, args.radius)
+        results = rtree.search_flat(search_point, args.radius)
         
         print(f"\nTìm thấy {len(results)} trạm xăng:")
         print("-" * 80)
@@ -462,7 +758,7 @@ def main():
                 start = time.perf_counter()
                 
                 search_point = Point(lat, lon, {})
-                results = rtree.search(search_point, radius)
+                results = rtree.search_flat(search_point, radius)
 
                 end = time.perf_counter()
                 elapsed_ms = (end - start) * 1000
@@ -0,0 +1,26 @@
+"""
+Biên dịch sẵn (AOT) kernel rtree_search_jit (rtree_kernel.py) thành extension rtree_native
+bằng numba.pycc, để truy vấn đầu tiên của new_code_gui không phải chờ JIT.
+
+Chạy: python build_rtree_native.py  (cần Numba và trình biên dịch C, không cần PyQt5; file .so/.pyd
+được đặt cạnh new_code_gui.py và được import tự động nếu có)
+
+Lưu ý: numba.pycc đã bị Numba đánh dấu deprecated và sẽ bị gỡ bỏ. Khi đó bỏ qua bước này,
+new_code_gui vẫn dùng bản @njit(cache=True) (chỉ lần chạy đầu tiên phải chờ biên dịch).
+"""
+import os
+from numba.pycc import CC
+
+import rtree_kernel
+
+cc = CC('rtree_native')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Cùng kiểu với các mảng do RTree.flatten tạo ra
+cc.export(
+    'rtree_search',
+    'Tuple((i8[:], f8[:]))(f8[:, :], i8[:], i8[:], b1[:], f8[:], f8[:], f8[:], f8, f8, f8)'
+)(rtree_kernel.rtree_search_jit.py_func)
+
+if __name__ == '__main__':
+    cc.compile()
@@ -1,10 +1,19 @@
 import json
 import math
+import os
+import pickle
+from functools import lru_cache
 from typing import List, Tuple, Dict, Optional
 from dataclasses import dataclass
+import numpy as np
 import requests
 
-@dataclass
+try:
+    import orjson
+except ImportError:  # orjson không bắt buộc, nếu chưa cài thì dùng json chuẩn
+    orjson = None
+
+@dataclass(slots=True, frozen=True)
 class BoundingBox:
     """Bounding box cho R-Tree node"""
     min_lat: float
@@ -44,6 +53,8 @@ class BoundingBox:
 
 class RTreeNode:
     """Node của R-Tree"""
+    __slots__ = ('max_entries', 'is_leaf', 'entries', 'bbox')
+    
     def __init__(self, max_entries=4, is_leaf=True):
         self.max_entries = max_entries
         self.is_leaf = is_leaf
@@ -74,24 +85,71 @@ class RTree:
         self.max_entries = max_entries
         self.root = RTreeNode(max_entries, is_leaf=True)
     
-    def insert(self, point: Tuple[float, float], data: Dict):
+    def insert(self, point: Tuple[float, float], data: int):
         """Chèn một điểm vào R-Tree"""
         bbox = BoundingBox(point[0], point[0], point[1], point[1])
-        self._insert(self.root, bbox, data)
+        
+        # Đi xuống node lá, ghi lại đường đi để cập nhật bbox khi quay lên
+        path = []
+        node = self.root
+        while not node.is_leaf:
+            path.append(node)
+            node = self._choose_subtree(node, bbox)
+        
+        node.entries.append((bbox, data))
+        node.compute_bbox()
+        sibling = self._split_node(node) if len(node.entries) > self.max_entries else None
+        
+        for ancestor in reversed(path):
+            # bbox của node con đã thay đổi, cập nhật lại trong entries và gắn node anh em mới (nếu có)
+            ancestor.entries = [(child_node.bbox, child_node) for _, child_node in ancestor.entries]
+            if sibling is not None:
+                ancestor.entries.append((sibling.bbox, sibling))
+            ancestor.compute_bbox()
+            sibling = self._split_node(ancestor) if len(ancestor.entries) > self.max_entries else None
+        
+        if sibling is not None:
+            # Root bị tách: tạo root mới chứa root cũ và node anh em
+            new_root = RTreeNode(self.max_entries, is_leaf=False)
+            new_root.entries = [(self.root.bbox, self.root), (sibling.bbox, sibling)]
+            new_root.compute_bbox()
+            self.root = new_root
     
-    def _insert(self, node: RTreeNode, bbox: BoundingBox, data: Dict):
-        """Chèn đệ quy"""
-        if node.is_leaf:
-            node.entries.append((bbox, data))
-            node.compute_bbox()
-            
-            if len(node.entries) > self.max_entries:
-                self._split_node(node)
-        else:
-            # Tìm child node tốt nhất để chèn
-            best_child = self._choose_subtree(node, bbox)
-            self._insert(best_child, bbox, data)
-            node.compute_bbox()
+    def bulk_load(self, points: List[Tuple[Tuple[float, float], int]]):
+        """Xây dựng lại R-Tree từ toàn bộ điểm bằng Sort-Tile-Recursive (STR) thay vì insert từng điểm"""
+        # Tầng lá
+        nodes = self._str_pack([(BoundingBox(lat, lat, lon, lon), data) for (lat, lon), data in points],
+                               is_leaf=True)
+        
+        # Gom dần các node thành tầng nội bộ cho tới khi chỉ còn 1 node (root)
+        while len(nodes) > 1:
+            nodes = self._str_pack([(node.bbox, node) for node in nodes], is_leaf=False)
+        
+        self.root = nodes[0] if nodes else RTreeNode(self.max_entries, is_leaf=True)
+    
+    def _str_pack(self, entries: List[Tuple[BoundingBox, object]], is_leaf: bool) -> List[RTreeNode]:
+        """Đóng gói các entry thành các node (tối đa max_entries entry/node) theo STR"""
+        if not entries:
+            return []
+        
+        M = self.max_entries
+        num_slices = math.ceil(math.sqrt(math.ceil(len(entries) / M)))
+        slice_size = num_slices * M
+        
+        # Sắp xếp theo tâm latitude, chia thành các lát (slice)
+        entries = sorted(entries, key=lambda e: e[0].min_lat + e[0].max_lat)
+        
+        nodes = []
+        for i in range(0, len(entries), slice_size):
+            # Trong mỗi lát, sắp xếp theo tâm longitude rồi cắt thành các node
+            slice_entries = sorted(entries[i:i + slice_size], key=lambda e: e[0].min_lon + e[0].max_lon)
+            for j in range(0, len(slice_entries), M):
+                node = RTreeNode(M, is_leaf=is_leaf)
+                node.entries = slice_entries[j:j + M]
+                node.compute_bbox()
+                nodes.append(node)
+        
+        return nodes
     
     def _choose_subtree(self, node: RTreeNode, bbox: BoundingBox) -> RTreeNode:
         """Chọn subtree tốt nhất để chèn"""
@@ -120,38 +178,38 @@ class RTree:
             max(bbox1.max_lon, bbox2.max_lon)
         )
     
-    def _split_node(self, node: RTreeNode):
-        """Chia node khi quá nhiều entries (simplified split)"""
+    def _split_node(self, node: RTreeNode) -> RTreeNode:
+        """Chia node khi quá nhiều entries (simplified split), trả về node anh em mới"""
         # Đơn giản hóa: chia làm đôi theo latitude
         node.entries.sort(key=lambda x: x[0].min_lat)
         mid = len(node.entries) // 2
         
-        # Giữ nửa đầu trong node hiện tại
+        # Giữ nửa đầu trong node hiện tại, nửa sau chuyển sang node anh em
+        sibling = RTreeNode(self.max_entries, is_leaf=node.is_leaf)
+        sibling.entries = node.entries[mid:]
+        sibling.compute_bbox()
         node.entries = node.entries[:mid]
         node.compute_bbox()
+        return sibling
     
-    def search(self, center: Tuple[float, float], radius_km: float) -> List[Dict]:
-        """Tìm kiếm các điểm trong bán kính"""
+    def search(self, center: Tuple[float, float], radius_km: float) -> List[int]:
+        """Tìm các điểm ứng viên (index trạm) trong các node lá giao với hình tròn"""
         results = []
-        self._search(self.root, center, radius_km, results)
-        return results
-    
-    def _search(self, node: RTreeNode, center: Tuple[float, float], 
-                radius_km: float, results: List[Dict]):
-        """Tìm kiếm đệ quy"""
-        if node.bbox and not node.bbox.intersects_circle(center, radius_km):
-            return
+        if self.root.bbox and not self.root.bbox.intersects_circle(center, radius_km):
+            return results
         
-        if node.is_leaf:
-            for bbox, data in node.entries:
-                point = tuple(data['coordinates'])
-                dist = haversine_distance(center, point)
-                if dist <= radius_km:
-                    results.append({**data, 'distance_km': round(dist, 2)})
-        else:
-            for bbox, child_node in node.entries:
-                if bbox.intersects_circle(center, radius_km):
-                    self._search(child_node, center, radius_km, results)
+        # Duyệt theo chiều sâu bằng stack thay vì đệ quy
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                # Khoảng cách được tính sau trên mảng toạ độ, ở đây chỉ gom index
+                results.extend(data for _, data in node.entries)
+            else:
+                # Chỉ đưa vào stack các node con giao với hình tròn (đảo ngược để giữ thứ tự duyệt)
+                stack.extend(child_node for bbox, child_node in reversed(node.entries)
+                             if bbox.intersects_circle(center, radius_km))
+        return results
 
 def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
     """Tính khoảng cách Haversine giữa 2 tọa độ (km)"""
@@ -170,8 +228,34 @@ def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float])
     
     return R * c
 
-def get_location_info(lat: float, lon: float) -> Dict:
-    """Lấy thông tin địa điểm từ OpenStreetMap Nominatim API"""
+# Kích thước ô lưới (độ) dùng để lọc nhanh các khu vực gần tâm trong find_relevant_areas
+GRID_CELL_DEG = 0.1
+
+def _grid_cell(value: float) -> int:
+    """Chỉ số ô lưới chứa một giá trị vĩ độ/kinh độ"""
+    return math.floor(value / GRID_CELL_DEG)
+
+def haversine_distance_np(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Tính khoảng cách Haversine từ 1 tọa độ tới mảng các tọa độ (km)"""
+    R = 6371  # Bán kính Trái Đất (km)
+    
+    dlat = np.radians(lats - lat)
+    dlon = np.radians(lons - lon)
+    
+    a = (np.sin(dlat/2)**2 + 
+         math.cos(math.radians(lat)) * np.cos(np.radians(lats)) * 
+         np.sin(dlon/2)**2)
+    c = 2 * np.arcsin(np.sqrt(a))
+    
+    return R * c
+
+# Dùng chung một Session để giữ kết nối (keep-alive) giữa các lần gọi API
+_session = requests.Session()
+_session.headers['User-Agent'] = 'GasStationFinder/1.0'
+
+@lru_cache(maxsize=10000)
+def _reverse_geocode(lat: float, lon: float) -> Dict:
+    """Gọi Nominatim API, kết quả được cache theo toạ độ đã làm tròn (lỗi thì raise, không cache)"""
     url = "https://nominatim.openstreetmap.org/reverse"
     params = {
         'lat': lat,
@@ -180,43 +264,71 @@ def get_location_info(lat: float, lon: float) -> Dict:
         'addressdetails': 1,
         'zoom': 18
     }
-    headers = {
-        'User-Agent': 'GasStationFinder/1.0'
-    }
     
+    response = _session.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+    address = data.get('address', {})
+    return {
+        'ward': address.get('suburb') or address.get('neighbourhood') or address.get('hamlet'),
+        'province': address.get('state') or address.get('province') or address.get('city')
+    }
+
+def get_location_info(lat: float, lon: float) -> Dict:
+    """Lấy thông tin địa điểm từ OpenStreetMap Nominatim API"""
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            address = data.get('address', {})
-            return {
-                'ward': address.get('suburb') or address.get('neighbourhood') or address.get('hamlet'),
-                'province': address.get('state') or address.get('province') or address.get('city')
-            }
+        # Làm tròn 3 chữ số thập phân (~100m) để các điểm gần nhau dùng lại kết quả đã cache
+        return dict(_reverse_geocode(round(lat, 3), round(lon, 3)))
     except Exception as e:
         print(f"Lỗi khi gọi API: {e}")
     
     return {'ward': None, 'province': None}
 
+# Phiên bản định dạng cache R-Tree, tăng lên mỗi khi đổi cấu trúc BoundingBox/RTreeNode/RTree
+CACHE_VERSION = 2
+# Số entry tối đa mỗi node của các R-Tree theo province/ward
+RTREE_MAX_ENTRIES = 10
+
 class GasStationFinder:
     """Hệ thống tìm kiếm trạm xăng với R-Tree phân cấp"""
     def __init__(self, json_file: str):
-        self.stations = self._load_data(json_file)
-        self.province_index = {}  # {province: {ward: [stations]}}
+        self.stations = self._load_data(json_file)  # Chỉ dùng để hiển thị, tra theo index
+        self.lats: Optional[np.ndarray] = None  # Vĩ độ các trạm (mảng song song với stations)
+        self.lons: Optional[np.ndarray] = None  # Kinh độ các trạm
+        self.province_index = {}  # {province: {ward: [index trạm]}}
         self.rtrees = {}  # {(province, ward): RTree}
-        self._build_index()
+        self.area_keys: List[Tuple[str, str]] = []  # Các (province, ward) theo thứ tự của rtrees
+        self.area_grid: Dict[Tuple[int, int], List[int]] = {}  # {ô lưới: [index trong area_keys]}
+        self._build_index(json_file)
     
     def _load_data(self, json_file: str) -> List[Dict]:
         """Load dữ liệu từ file JSON"""
+        if orjson is not None:
+            with open(json_file, 'rb') as f:
+                return orjson.loads(f.read())
         with open(json_file, 'r', encoding='utf-8') as f:
             return json.load(f)
     
-    def _build_index(self):
-        """Xây dựng index theo province/ward và R-Tree"""
+    def _build_index(self, json_file: str):
+        """Xây dựng index theo province/ward và R-Tree (dùng lại cache trên đĩa nếu còn mới)"""
+        # Toạ độ lưu thành 2 mảng liên tục, không tra lại dict khi tính khoảng cách
+        self.lats = np.fromiter((s['coordinates'][0] for s in self.stations),
+                                dtype=np.float64, count=len(self.stations))
+        self.lons = np.fromiter((s['coordinates'][1] for s in self.stations),
+                                dtype=np.float64, count=len(self.stations))
+        
+        cache_file = f"{json_file}.rtree.pkl"
+        # Khoá cache gồm phiên bản định dạng, max_entries, mtime và kích thước file JSON
+        stat = os.stat(json_file)
+        cache_key = (CACHE_VERSION, RTREE_MAX_ENTRIES, stat.st_mtime_ns, stat.st_size)
+        if self._load_index_cache(cache_file, cache_key):
+            print(f"Đã đọc {len(self.rtrees)} R-Tree từ cache {cache_file}")
+            return
+        
         print("Đang xây dựng R-Tree index...")
         
         # Nhóm stations theo province và ward
-        for station in self.stations:
+        for i, station in enumerate(self.stations):
             province = station.get('province', 'Unknown')
             ward = station.get('ward', 'Unknown')
             
@@ -225,26 +337,100 @@ class GasStationFinder:
             if ward not in self.province_index[province]:
                 self.province_index[province][ward] = []
             
-            self.province_index[province][ward].append(station)
+            self.province_index[province][ward].append(i)
         
-        # Tạo R-Tree cho mỗi (province, ward)
+        # Tạo R-Tree cho mỗi (province, ward) bằng bulk load (STR)
+        lats = self.lats.tolist()
+        lons = self.lons.tolist()
         for province, wards in self.province_index.items():
-            for ward, stations in wards.items():
-                rtree = RTree(max_entries=10)
-                for station in stations:
-                    coords = tuple(station['coordinates'])
-                    rtree.insert(coords, station)
+            for ward, indices in wards.items():
+                rtree = RTree(max_entries=RTREE_MAX_ENTRIES)
+                rtree.bulk_load([((lats[i], lons[i]), i) for i in indices])
                 self.rtrees[(province, ward)] = rtree
         
         print(f"Đã xây dựng {len(self.rtrees)} R-Tree cho các province/ward")
+        self._save_index_cache(cache_file, cache_key)
+        self._build_area_grid()
+    
+    def _build_area_grid(self):
+        """Gắn mỗi (province, ward) vào các ô lưới GRID_CELL_DEG độ mà bbox root của nó phủ lên"""
+        self.area_keys = list(self.rtrees)
+        self.area_grid = {}
+        for k, area in enumerate(self.area_keys):
+            bbox = self.rtrees[area].root.bbox
+            if bbox is None:
+                continue
+            for cell_lat in range(_grid_cell(bbox.min_lat), _grid_cell(bbox.max_lat) + 1):
+                for cell_lon in range(_grid_cell(bbox.min_lon), _grid_cell(bbox.max_lon) + 1):
+                    self.area_grid.setdefault((cell_lat, cell_lon), []).append(k)
+    
+    def _load_index_cache(self, cache_file: str, cache_key: Tuple[int, int, int, int]) -> bool:
+        """Đọc province_index và các R-Tree đã lưu (kèm lưới khu vực), trả về False nếu không có cache hợp lệ"""
+        try:
+            with open(cache_file, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception:
+            # Chưa có cache, file hỏng hoặc lưu từ phiên bản class khác: xây lại
+            return False
+        
+        if not isinstance(cache, dict) or cache.get('key') != cache_key:
+            return False
+        try:
+            self.province_index = cache['province_index']
+            self.rtrees = cache['rtrees']
+            self._build_area_grid()
+        except Exception:
+            # Cache đọc được nhưng dữ liệu không dùng được (vd. bbox thiếu toạ độ): xây lại
+            self.province_index = {}
+            self.rtrees = {}
+            self.area_keys = []
+            self.area_grid = {}
+            return False
+        return True
+    
+    def _save_index_cache(self, cache_file: str, cache_key: Tuple[int, int, int, int]):
+        """Lưu province_index và các R-Tree ra đĩa để lần chạy sau không phải xây lại"""
+        cache = {'key': cache_key, 'province_index': self.province_index, 'rtrees': self.rtrees}
+        tmp_file = cache_file + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            # Không ghi được thư mục hoặc không pickle được class: bỏ qua cache
+            print(f"Không lưu được cache R-Tree: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
     
     def find_relevant_areas(self, center: Tuple[float, float], 
                            radius_km: float) -> List[Tuple[str, str]]:
         """Tìm các (province, ward) nằm trong bán kính"""
-        relevant = []
+        lat, lon = center
+        # Khung lat/lon bao hình tròn: điểm cách tâm <= radius_km thì lệch vĩ độ <= d
+        # và lệch kinh độ <= asin(sin(d) / cos(lat)) (d là bán kính tính theo radian)
+        d = radius_km / 6371
+        min_lat = lat - math.degrees(d)
+        max_lat = lat + math.degrees(d)
+        
+        candidates = range(len(self.area_keys))
+        if min_lat > -90 and max_lat < 90 and math.sin(d) < math.cos(math.radians(lat)):
+            dlon = math.degrees(math.asin(math.sin(d) / math.cos(math.radians(lat))))
+            lat_cells = range(_grid_cell(min_lat), _grid_cell(max_lat) + 1)
+            lon_cells = range(_grid_cell(lon - dlon), _grid_cell(lon + dlon) + 1)
+            # Khung vắt qua kinh tuyến 180 hoặc bán kính lớn phủ quá nhiều ô thì duyệt thẳng danh sách khu vực
+            if (-180 <= lon - dlon and lon + dlon <= 180
+                    and len(lat_cells) * len(lon_cells) < len(self.area_keys)):
+                hits = set()
+                for cell_lat in lat_cells:
+                    for cell_lon in lon_cells:
+                        hits.update(self.area_grid.get((cell_lat, cell_lon), ()))
+                candidates = sorted(hits)
         
-        for (province, ward), rtree in self.rtrees.items():
-            if rtree.root.bbox and rtree.root.bbox.intersects_circle(center, radius_km):
+        relevant = []
+        for k in candidates:
+            province, ward = self.area_keys[k]
+            bbox = self.rtrees[(province, ward)].root.bbox
+            if bbox and bbox.intersects_circle(center, radius_km):
                 relevant.append((province, ward))
         
         return relevant
@@ -259,14 +445,22 @@ class GasStationFinder:
         print(f"Tìm thấy {len(relevant_areas)} khu vực liên quan")
         
         # Tìm kiếm trong các R-Tree liên quan
-        all_results = []
+        candidates = []
         for province, ward in relevant_areas:
             rtree = self.rtrees[(province, ward)]
-            results = rtree.search(center, radius_km)
-            all_results.extend(results)
+            candidates.extend(rtree.search(center, radius_km))
+        
+        # Tính khoảng cách cho toàn bộ ứng viên một lần trên mảng toạ độ
+        ids = np.array(candidates, dtype=np.int64)
+        distances = haversine_distance_np(lat, lon, self.lats[ids], self.lons[ids])
+        hits = np.nonzero(distances <= radius_km)[0]
+        
+        # Sắp xếp theo khoảng cách (đã làm tròn như khi hiển thị) bằng argsort ổn định
+        distances_km = [round(d, 2) for d in distances[hits].tolist()]
+        order = np.argsort(distances_km, kind='stable')
         
-        # Sắp xếp theo khoảng cách
-        all_results.sort(key=lambda x: x['distance_km'])
+        all_results = [{**self.stations[ids[hits[k]]], 'distance_km': distances_km[k]}
+                       for k in order]
         
         return all_results
 
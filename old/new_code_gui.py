@@ -1,150 +1,307 @@
 import sys
 import json
 import math
+import heapq
+from functools import lru_cache
 from typing import List, Tuple, Dict, Optional
-from dataclasses import dataclass
+import numpy as np
 import requests
+
+try:
+    import orjson
+except ImportError:  # orjson không bắt buộc, nếu chưa cài thì dùng json chuẩn
+    orjson = None
+
+from rtree_kernel import (haversine_distance, haversine_precomp, fast_dist_sq, rtree_search_jit,
+                          FAST_REJECT_MAX_RADIUS_KM, FAST_REJECT_MARGIN, KM_PER_DEG)
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLineEdit, QLabel, 
                              QTextEdit, QSplitter)
-from PyQt5.QtCore import Qt, QUrl, pyqtSignal, QObject
+from PyQt5.QtCore import Qt, QUrl, pyqtSignal, QObject, QThread
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 from PyQt5.QtWebChannel import QWebChannel
 
 # ============ R-Tree Implementation ============
-@dataclass
-class BoundingBox:
-    """Bounding box cho R-Tree node"""
-    min_lat: float
-    max_lat: float
-    min_lon: float
-    max_lon: float
-    
-    def area(self) -> float:
-        return (self.max_lat - self.min_lat) * (self.max_lon - self.min_lon)
-    
-    def expand(self, point: Tuple[float, float]) -> 'BoundingBox':
-        lat, lon = point
-        return BoundingBox(
-            min(self.min_lat, lat),
-            max(self.max_lat, lat),
-            min(self.min_lon, lon),
-            max(self.max_lon, lon)
-        )
-    
-    def contains_point(self, point: Tuple[float, float]) -> bool:
-        lat, lon = point
-        return (self.min_lat <= lat <= self.max_lat and 
-                self.min_lon <= lon <= self.max_lon)
-    
-    def intersects_circle(self, center: Tuple[float, float], radius_km: float) -> bool:
-        lat, lon = center
-        closest_lat = max(self.min_lat, min(lat, self.max_lat))
-        closest_lon = max(self.min_lon, min(lon, self.max_lon))
-        dist = haversine_distance(center, (closest_lat, closest_lon))
-        return dist <= radius_km
+def bbox_intersects_circle(min_lat: float, max_lat: float, min_lon: float, max_lon: float,
+                           clat: float, clon: float, radius_km: float) -> bool:
+    """Kiểm tra bbox (min_lat, max_lat, min_lon, max_lon) có giao với hình tròn không"""
+    closest_lat = max(min_lat, min(clat, max_lat))
+    closest_lon = max(min_lon, min(clon, max_lon))
+    return haversine_distance((clat, clon), (closest_lat, closest_lon)) <= radius_km
+
+def bbox_intersects_circle_planar(min_lat: float, max_lat: float, min_lon: float, max_lon: float,
+                                  clat: float, clon: float, kx: float, ky: float, reject_sq: float) -> bool:
+    """
+    Như bbox_intersects_circle nhưng đo khoảng cách phẳng với kx, ky km/độ kinh/vĩ độ quanh tâm, không dùng
+    hàm lượng giác. Chỉ dùng với bán kính <= FAST_REJECT_MAX_RADIUS_KM và reject_sq = (bán kính * FAST_REJECT_MARGIN)²
+    """
+    dy = (max(min_lat, min(clat, max_lat)) - clat) * ky
+    dx = (max(min_lon, min(clon, max_lon)) - clon) * kx
+    return dx * dx + dy * dy <= reject_sq
 
 class RTreeNode:
     def __init__(self, max_entries=4, is_leaf=True):
         self.max_entries = max_entries
         self.is_leaf = is_leaf
-        self.entries = []
-        self.bbox: Optional[BoundingBox] = None
+        # Node lá (SoA): toạ độ và id trạm (index trong RTree.stations_arr)
+        self.lats = np.empty(0, dtype=np.float64)
+        self.lons = np.empty(0, dtype=np.float64)
+        self.ids = np.empty(0, dtype=np.int64)
+        # Tính sẵn theo trạm cho haversine_precomp (không đổi giữa các truy vấn)
+        self.rad_lats = np.empty(0, dtype=np.float64)
+        self.rad_lons = np.empty(0, dtype=np.float64)
+        self.cos_lats = np.empty(0, dtype=np.float64)
+        # Node nội bộ: bbox các con (K, 4) = (min_lat, max_lat, min_lon, max_lon) và các node con tương ứng
+        self.child_bboxes = np.empty((0, 4), dtype=np.float64)
+        self.child_refs: List['RTreeNode'] = []
+        self.bbox: Optional[Tuple[float, float, float, float]] = None  # (min_lat, max_lat, min_lon, max_lon)
+    
+    def size(self) -> int:
+        return self.ids.size if self.is_leaf else len(self.child_refs)
+    
+    def set_points(self, lats: np.ndarray, lons: np.ndarray, ids: np.ndarray):
+        self.lats, self.lons, self.ids = lats, lons, ids
+        self.rad_lats = np.radians(lats)
+        self.rad_lons = np.radians(lons)
+        self.cos_lats = np.cos(self.rad_lats)
+    
+    def set_children(self, children: List['RTreeNode']):
+        self.child_refs = list(children)
+        self.child_bboxes = np.array([c.bbox for c in self.child_refs], dtype=np.float64).reshape(-1, 4)
     
     def compute_bbox(self):
-        if not self.entries:
+        if self.size() == 0:
             return None
-        first_bbox = self.entries[0][0]
-        min_lat, max_lat = first_bbox.min_lat, first_bbox.max_lat
-        min_lon, max_lon = first_bbox.min_lon, first_bbox.max_lon
-        for bbox, _ in self.entries[1:]:
-            min_lat = min(min_lat, bbox.min_lat)
-            max_lat = max(max_lat, bbox.max_lat)
-            min_lon = min(min_lon, bbox.min_lon)
-            max_lon = max(max_lon, bbox.max_lon)
-        self.bbox = BoundingBox(min_lat, max_lat, min_lon, max_lon)
+        if self.is_leaf:
+            self.bbox = (float(self.lats.min()), float(self.lats.max()),
+                         float(self.lons.min()), float(self.lons.max()))
+        else:
+            b = self.child_bboxes
+            self.bbox = (float(b[:, 0].min()), float(b[:, 1].max()),
+                         float(b[:, 2].min()), float(b[:, 3].max()))
         return self.bbox
 
 class RTree:
     def __init__(self, max_entries=4):
         self.max_entries = max_entries
         self.root = RTreeNode(max_entries, is_leaf=True)
+        self.stations_arr: List[Dict] = []  # Bảng trạm dùng chung, node lá chỉ lưu id (index trong bảng)
+        self.flat = None  # Cây dạng mảng cho rtree_search, tạo lại sau khi insert
     
     def insert(self, point: Tuple[float, float], data: Dict):
-        bbox = BoundingBox(point[0], point[0], point[1], point[1])
-        self._insert(self.root, bbox, data)
+        self.flat = None
+        self.stations_arr.append(data)
+        sibling = self._insert(self.root, point, len(self.stations_arr) - 1)
+        if sibling is not None:
+            # Root bị tách: tạo root mới chứa root cũ và node anh em
+            new_root = RTreeNode(self.max_entries, is_leaf=False)
+            new_root.set_children([self.root, sibling])
+            new_root.compute_bbox()
+            self.root = new_root
+    
+    def bulk_load(self, points: List[Tuple[Tuple[float, float], Dict]]):
+        """Xây dựng lại R-Tree từ toàn bộ điểm bằng Sort-Tile-Recursive (STR) thay vì insert từng điểm"""
+        self.flat = None
+        self.stations_arr = [data for _, data in points]
+        coords = np.array([point for point, _ in points], dtype=np.float64).reshape(-1, 2)
+        # Tầng lá: mỗi điểm là một bbox suy biến (lat, lat, lon, lon)
+        nodes = self._str_pack(coords[:, [0, 0, 1, 1]], is_leaf=True)
+        
+        # Gom dần các node thành tầng nội bộ cho tới khi chỉ còn 1 node (root)
+        while len(nodes) > 1:
+            bboxes = np.array([node.bbox for node in nodes], dtype=np.float64).reshape(-1, 4)
+            nodes = self._str_pack(bboxes, is_leaf=False, children=nodes)
+        
+        self.root = nodes[0] if nodes else RTreeNode(self.max_entries, is_leaf=True)
+    
+    def _str_pack(self, bboxes: np.ndarray, is_leaf: bool,
+                  children: Optional[List[RTreeNode]] = None) -> List[RTreeNode]:
+        """
+        Đóng gói các entry thành các node (tối đa max_entries entry/node) theo STR.
+        bboxes[i] là bbox của entry i: trạm có id i (tầng lá) hoặc children[i] (tầng nội bộ).
+        """
+        if not len(bboxes):
+            return []
+        
+        M = self.max_entries
+        num_slices = math.ceil(math.sqrt(math.ceil(len(bboxes) / M)))
+        slice_size = num_slices * M
+        
+        # Sắp xếp theo tâm latitude, chia thành các lát (slice)
+        order = np.argsort(bboxes[:, 0] + bboxes[:, 1], kind='stable')
+        
+        nodes = []
+        for i in range(0, len(order), slice_size):
+            # Trong mỗi lát, sắp xếp theo tâm longitude rồi cắt thành các node
+            slice_idx = order[i:i + slice_size]
+            slice_idx = slice_idx[np.argsort(bboxes[slice_idx, 2] + bboxes[slice_idx, 3], kind='stable')]
+            for j in range(0, len(slice_idx), M):
+                idx = slice_idx[j:j + M]
+                node = RTreeNode(M, is_leaf=is_leaf)
+                if is_leaf:
+                    node.set_points(bboxes[idx, 0], bboxes[idx, 2], idx.astype(np.int64))
+                else:
+                    node.child_bboxes = bboxes[idx]
+                    node.child_refs = [children[k] for k in idx.tolist()]
+                node.compute_bbox()
+                nodes.append(node)
+        
+        return nodes
     
-    def _insert(self, node: RTreeNode, bbox: BoundingBox, data: Dict):
+    def _insert(self, node: RTreeNode, point: Tuple[float, float], station_id: int) -> Optional[RTreeNode]:
+        """Chèn trạm station_id vào cây con gốc node, trả về node anh em mới nếu node bị tách"""
         if node.is_leaf:
-            node.entries.append((bbox, data))
-            node.compute_bbox()
-            if len(node.entries) > self.max_entries:
-                self._split_node(node)
+            node.set_points(np.append(node.lats, point[0]), np.append(node.lons, point[1]),
+                            np.append(node.ids, station_id))
         else:
-            best_child = self._choose_subtree(node, bbox)
-            self._insert(best_child, bbox, data)
-            node.compute_bbox()
+            best = self._choose_subtree(node, point)
+            best_child = node.child_refs[best]
+            sibling = self._insert(best_child, point, station_id)
+            # bbox của node con đã thay đổi, cập nhật lại trong child_bboxes
+            node.child_bboxes[best] = best_child.bbox
+            if sibling is not None:
+                node.set_children(node.child_refs + [sibling])
+        node.compute_bbox()
+        if node.size() > self.max_entries:
+            return self._split_node(node)
+        return None
+    
+    def _choose_subtree(self, node: RTreeNode, point: Tuple[float, float]) -> int:
+        """Index của node con cần mở rộng diện tích ít nhất để chứa điểm"""
+        lat, lon = point
+        b = node.child_bboxes
+        original_area = (b[:, 1] - b[:, 0]) * (b[:, 3] - b[:, 2])
+        new_area = ((np.maximum(b[:, 1], lat) - np.minimum(b[:, 0], lat)) *
+                    (np.maximum(b[:, 3], lon) - np.minimum(b[:, 2], lon)))
+        return int(np.argmin(new_area - original_area))
     
-    def _choose_subtree(self, node: RTreeNode, bbox: BoundingBox) -> RTreeNode:
-        min_enlargement = float('inf')
-        best_child = None
-        for child_bbox, child_node in node.entries:
-            original_area = child_bbox.area()
-            new_bbox = self._merge_bbox(child_bbox, bbox)
-            new_area = new_bbox.area()
-            enlargement = new_area - original_area
-            if enlargement < min_enlargement:
-                min_enlargement = enlargement
-                best_child = child_node
-        return best_child
+    def _split_node(self, node: RTreeNode) -> RTreeNode:
+        """Chia đôi node theo latitude: nửa đầu giữ lại, nửa sau chuyển sang node anh em mới"""
+        sibling = RTreeNode(self.max_entries, is_leaf=node.is_leaf)
+        if node.is_leaf:
+            order = np.argsort(node.lats, kind='stable')
+            mid = order.size // 2
+            keep, move = order[:mid], order[mid:]
+            sibling.set_points(node.lats[move], node.lons[move], node.ids[move])
+            node.set_points(node.lats[keep], node.lons[keep], node.ids[keep])
+        else:
+            order = np.argsort(node.child_bboxes[:, 0], kind='stable')
+            mid = order.size // 2
+            keep, move = order[:mid], order[mid:]
+            sibling.child_bboxes = node.child_bboxes[move]
+            sibling.child_refs = [node.child_refs[k] for k in move.tolist()]
+            node.child_bboxes = node.child_bboxes[keep]
+            node.child_refs = [node.child_refs[k] for k in keep.tolist()]
+        sibling.compute_bbox()
+        node.compute_bbox()
+        return sibling
     
-    def _merge_bbox(self, bbox1: BoundingBox, bbox2: BoundingBox) -> BoundingBox:
-        return BoundingBox(
-            min(bbox1.min_lat, bbox2.min_lat),
-            max(bbox1.max_lat, bbox2.max_lat),
-            min(bbox1.min_lon, bbox2.min_lon),
-            max(bbox1.max_lon, bbox2.max_lon)
+    def flatten(self):
+        """
+        Làm phẳng cây thành các mảng (đánh số node theo BFS nên các con của một node nằm liền nhau):
+        bboxes[i] = (min_lat, max_lat, min_lon, max_lon), các con của node i (trạm nếu là lá)
+        có index children_start[i] .. children_start[i] + children_count[i] - 1.
+        point_ids[j] là index trong stations_arr của điểm j.
+        """
+        nodes = [self.root]
+        bboxes, children_start, children_count, is_leaf = [], [], [], []
+        rad_lats, rad_lons, cos_lats, ids = [], [], [], []
+        num_points = 0
+        i = 0
+        while i < len(nodes):
+            node = nodes[i]
+            i += 1
+            bboxes.append(node.bbox or (0.0, 0.0, 0.0, 0.0))
+            is_leaf.append(node.is_leaf)
+            children_count.append(node.size())
+            if node.is_leaf:
+                children_start.append(num_points)
+                num_points += node.size()
+                rad_lats.append(node.rad_lats)
+                rad_lons.append(node.rad_lons)
+                cos_lats.append(node.cos_lats)
+                ids.append(node.ids)
+            else:
+                children_start.append(len(nodes))
+                nodes.extend(node.child_refs)
+        
+        self.flat = (
+            np.array(bboxes, dtype=np.float64).reshape(-1, 4),
+            np.array(children_start, dtype=np.int64),
+            np.array(children_count, dtype=np.int64),
+            np.array(is_leaf, dtype=np.bool_),
+            np.concatenate(rad_lats),
+            np.concatenate(rad_lons),
+            np.concatenate(cos_lats),
+            np.concatenate(ids),
         )
+        return self.flat
     
-    def _split_node(self, node: RTreeNode):
-        node.entries.sort(key=lambda x: x[0].min_lat)
-        mid = len(node.entries) // 2
-        node.entries = node.entries[:mid]
-        node.compute_bbox()
+    def search(self, center: Tuple[float, float], radius_km: float) -> List[Tuple[float, int]]:
+        """Các cặp (khoảng cách km, id trạm trong stations_arr) nằm trong bán kính, chưa sắp xếp"""
+        if rtree_search is not None:
+            if self.flat is None:
+                self.flatten()
+            (bboxes, children_start, children_count, is_leaf,
+             point_rad_lat, point_rad_lon, point_cos_lat, point_ids) = self.flat
+            ids, distances = rtree_search(bboxes, children_start, children_count, is_leaf,
+                                          point_rad_lat, point_rad_lon, point_cos_lat,
+                                          center[0], center[1], radius_km)
+            return list(zip(distances.tolist(), point_ids[ids].tolist()))
+        
+        return self._search(center, radius_km)
     
-    def search(self, center: Tuple[float, float], radius_km: float) -> List[Dict]:
+    def _search(self, center: Tuple[float, float], radius_km: float) -> List[Tuple[float, int]]:
+        """Duyệt cây bằng stack thay vì đệ quy, node con chỉ được đưa vào stack khi bbox giao hình tròn"""
         results = []
-        self._search(self.root, center, radius_km, results)
+        clat, clon = center
+        if self.root.bbox and not bbox_intersects_circle(*self.root.bbox, clat, clon, radius_km):
+            return results
+        rad_clat, rad_clon = math.radians(clat), math.radians(clon)
+        cos_clat = math.cos(rad_clat)
+        # Bán kính nhỏ: bbox và trạm được loại bằng khoảng cách phẳng trước, không cần haversine
+        fast_reject = radius_km <= FAST_REJECT_MAX_RADIUS_KM
+        reject_sq = (radius_km * FAST_REJECT_MARGIN) ** 2
+        kx, ky = KM_PER_DEG * cos_clat, KM_PER_DEG
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                # Tính khoảng cách cho cả node lá một lần bằng NumPy
+                candidates = np.arange(node.size())
+                if fast_reject:
+                    # Loại trước các trạm chắc chắn nằm ngoài bán kính bằng xấp xỉ equirectangular
+                    dist_sq = fast_dist_sq(rad_clat, rad_clon, cos_clat, node.rad_lats, node.rad_lons)
+                    candidates = candidates[dist_sq <= reject_sq]
+                distances = haversine_precomp(rad_clat, rad_clon, cos_clat, node.rad_lats[candidates],
+                                              node.rad_lons[candidates], node.cos_lats[candidates])
+                inside = distances <= radius_km
+                results.extend(zip(distances[inside].tolist(), node.ids[candidates[inside]].tolist()))
+            else:
+                # Đưa con vào stack theo thứ tự ngược để giữ thứ tự duyệt như bản đệ quy
+                for child_node in reversed(node.child_refs):
+                    min_lat, max_lat, min_lon, max_lon = child_node.bbox
+                    if fast_reject:
+                        if bbox_intersects_circle_planar(min_lat, max_lat, min_lon, max_lon,
+                                                         clat, clon, kx, ky, reject_sq):
+                            stack.append(child_node)
+                    elif bbox_intersects_circle(min_lat, max_lat, min_lon, max_lon, clat, clon, radius_km):
+                        stack.append(child_node)
         return results
-    
-    def _search(self, node: RTreeNode, center: Tuple[float, float], 
-                radius_km: float, results: List[Dict]):
-        if node.bbox and not node.bbox.intersects_circle(center, radius_km):
-            return
-        if node.is_leaf:
-            for bbox, data in node.entries:
-                point = tuple(data['coordinates'])
-                dist = haversine_distance(center, point)
-                if dist <= radius_km:
-                    results.append({**data, 'distance_km': round(dist, 2)})
-        else:
-            for bbox, child_node in node.entries:
-                if bbox.intersects_circle(center, radius_km):
-                    self._search(child_node, center, radius_km, results)
 
-def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
-    lat1, lon1 = coord1
-    lat2, lon2 = coord2
-    R = 6371
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat/2)**2 + 
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-         math.sin(dlon/2)**2)
-    c = 2 * math.asin(math.sqrt(a))
-    return R * c
+try:
+    # Bản biên dịch sẵn (AOT) của rtree_search_jit do build_rtree_native.py tạo ra, truy vấn đầu không phải chờ JIT
+    from rtree_native import rtree_search
+except ImportError:
+    rtree_search = rtree_search_jit
 
-def get_location_info(lat: float, lon: float) -> Dict:
+# Dùng chung một Session để giữ kết nối (keep-alive) giữa các lần gọi API
+_session = requests.Session()
+_session.headers['User-Agent'] = 'GasStationFinder/1.0'
+
+@lru_cache(maxsize=1024)
+def _reverse_geocode(lat: float, lon: float) -> Dict:
+    """Gọi Nominatim API, kết quả được cache theo toạ độ đã làm tròn (lỗi thì raise, không cache)"""
     url = "https://nominatim.openstreetmap.org/reverse"
     params = {
         'lat': lat,
@@ -153,18 +310,21 @@ def get_location_info(lat: float, lon: float) -> Dict:
         'addressdetails': 1,
         'zoom': 18
     }
-    headers = {'User-Agent': 'GasStationFinder/1.0'}
+    response = _session.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+    address = data.get('address', {})
+    display = data.get('display_name', 'Unknown')
+    return {
+        'ward': address.get('suburb') or address.get('neighbourhood') or address.get('hamlet'),
+        'province': address.get('state') or address.get('province') or address.get('city'),
+        'display_name': display
+    }
+
+def get_location_info(lat: float, lon: float) -> Dict:
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            address = data.get('address', {})
-            display = data.get('display_name', 'Unknown')
-            return {
-                'ward': address.get('suburb') or address.get('neighbourhood') or address.get('hamlet'),
-                'province': address.get('state') or address.get('province') or address.get('city'),
-                'display_name': display
-            }
+        # Làm tròn 4 chữ số thập phân (~11m) để click lại gần chỗ cũ dùng lại kết quả đã cache
+        return dict(_reverse_geocode(round(lat, 4), round(lon, 4)))
     except Exception as e:
         print(f"API error: {e}")
     return {'ward': None, 'province': None, 'display_name': 'Unknown'}
@@ -172,50 +332,37 @@ def get_location_info(lat: float, lon: float) -> Dict:
 class GasStationFinder:
     def __init__(self, json_file: str):
         self.stations = self._load_data(json_file)
-        self.province_index = {}
-        self.rtrees = {}
+        self.rtree: Optional[RTree] = None
         self._build_index()
     
     def _load_data(self, json_file: str) -> List[Dict]:
+        if orjson is not None:
+            with open(json_file, 'rb') as f:
+                return orjson.loads(f.read())
         with open(json_file, 'r', encoding='utf-8') as f:
             return json.load(f)
     
     def _build_index(self):
-        for station in self.stations:
-            province = station.get('province', 'Unknown')
-            ward = station.get('ward', 'Unknown')
-            if province not in self.province_index:
-                self.province_index[province] = {}
-            if ward not in self.province_index[province]:
-                self.province_index[province][ward] = []
-            self.province_index[province][ward].append(station)
-        
-        for province, wards in self.province_index.items():
-            for ward, stations in wards.items():
-                rtree = RTree(max_entries=10)
-                for station in stations:
-                    coords = tuple(station['coordinates'])
-                    rtree.insert(coords, station)
-                self.rtrees[(province, ward)] = rtree
+        # Một R-Tree cho toàn bộ trạm, bulk load bằng STR (không tách theo province/ward)
+        self.rtree = RTree(max_entries=16)
+        self.rtree.bulk_load([(tuple(station['coordinates']), station) for station in self.stations])
+    
+    def find_in_radius(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, int]]:
+        """Tất cả trạm trong bán kính dưới dạng cặp (khoảng cách km, id trạm), chưa sắp xếp"""
+        return self.rtree.search((lat, lon), radius_km)
     
-    def find_relevant_areas(self, center: Tuple[float, float], 
-                           radius_km: float) -> List[Tuple[str, str]]:
-        relevant = []
-        for (province, ward), rtree in self.rtrees.items():
-            if rtree.root.bbox and rtree.root.bbox.intersects_circle(center, radius_km):
-                relevant.append((province, ward))
-        return relevant
+    def search(self, lat: float, lon: float, radius_km: float, top_k: Optional[int] = None) -> List[Dict]:
+        """Các trạm trong bán kính theo khoảng cách tăng dần, top_k thì chỉ lấy top_k trạm gần nhất"""
+        return self.nearest(self.find_in_radius(lat, lon, radius_km), top_k)
     
-    def search(self, lat: float, lon: float, radius_km: float) -> List[Dict]:
-        center = (lat, lon)
-        relevant_areas = self.find_relevant_areas(center, radius_km)
-        all_results = []
-        for province, ward in relevant_areas:
-            rtree = self.rtrees[(province, ward)]
-            results = rtree.search(center, radius_km)
-            all_results.extend(results)
-        all_results.sort(key=lambda x: x['distance_km'])
-        return all_results
+    def nearest(self, matches: List[Tuple[float, int]], top_k: Optional[int] = None) -> List[Dict]:
+        """
+        Sắp xếp các cặp (khoảng cách, id) tăng dần (top_k thì dùng heapq.nsmallest, O(n log k)),
+        chỉ tạo dict kết quả (kèm distance_km) cho các trạm được giữ lại
+        """
+        ordered = sorted(matches) if top_k is None else heapq.nsmallest(top_k, matches)
+        stations = self.rtree.stations_arr
+        return [{**stations[i], 'distance_km': round(dist, 2)} for dist, i in ordered]
 
 # ============ PyQt5 GUI ============
 class MapBridge(QObject):
@@ -225,6 +372,21 @@ class MapBridge(QObject):
     def __init__(self):
         super().__init__()
 
+class FinderLoader(QThread):
+    """Build GasStationFinder off the GUI thread"""
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, json_file):
+        super().__init__()
+        self.json_file = json_file
+    
+    def run(self):
+        try:
+            self.loaded.emit(GasStationFinder(self.json_file))
+        except Exception as e:
+            self.failed.emit(str(e))
+
 class GasStationMapApp(QMainWindow):
     def __init__(self, json_file='gas_stations.json'):
         super().__init__()
@@ -233,12 +395,13 @@ class GasStationMapApp(QMainWindow):
         
         self.selected_point = None
         self.finder = None
+        self.loader = None
         self.json_file = json_file
         
         # Initialize UI first
         self.init_ui()
         
-        # Then load data
+        # Then load data in the background
         self.load_data()
     
     def init_ui(self):
@@ -315,15 +478,24 @@ class GasStationMapApp(QMainWindow):
         main_layout.addWidget(splitter)
     
     def load_data(self):
-        """Load gas station data"""
+        """Load gas station data and build the R-Tree in a background thread"""
         self.log("Đang tải dữ liệu trạm xăng...")
-        try:
-            self.finder = GasStationFinder(self.json_file)
-            self.log(f"Đã tải {len(self.finder.stations)} trạm xăng")
-            self.log(f"Đã xây dựng {len(self.finder.rtrees)} R-Tree")
-        except Exception as e:
-            self.log(f"LỖI: {e}")
-            self.finder = None
+        self.loader = FinderLoader(self.json_file)
+        self.loader.loaded.connect(self.on_data_loaded)
+        self.loader.failed.connect(self.on_data_failed)
+        self.loader.start()
+    
+    def on_data_loaded(self, finder):
+        """Receive the finder built by FinderLoader"""
+        self.finder = finder
+        self.log(f"Đã tải {len(self.finder.stations)} trạm xăng")
+        self.log("Đã xây dựng R-Tree")
+        self.search_btn.setEnabled(self.selected_point is not None)
+    
+    def on_data_failed(self, message):
+        """Report a failed data load"""
+        self.log(f"LỖI: {message}")
+        self.finder = None
     
     def load_map(self):
         """Load OpenStreetMap with Leaflet"""
@@ -412,6 +584,12 @@ class GasStationMapApp(QMainWindow):
                     stationMarkers.push(marker);
                 }
                 
+                function addStationsBatch(stations) {
+                    stations.forEach(function(s) {
+                        addStation(s.lat, s.lon, s.name, s.addr, s.dist);
+                    });
+                }
+                
                 function showRadius(lat, lng, radius) {
                     if (radiusCircle) {
                         map.removeLayer(radiusCircle);
@@ -448,7 +626,8 @@ class GasStationMapApp(QMainWindow):
         self.location_label.setText(f"📍 {address}")
         self.log(f"Địa chỉ: {address}")
         
-        self.search_btn.setEnabled(True)
+        # Data may still be loading; on_data_loaded enables the button then
+        self.search_btn.setEnabled(self.finder is not None)
     
     def search_stations(self):
         """Search for gas stations"""
@@ -465,37 +644,36 @@ class GasStationMapApp(QMainWindow):
         self.log(f"\nBắt đầu tìm kiếm bán kính {radius}km...")
         
         # Search
-        results = self.finder.search(lat, lon, radius)
-        self.log(f"Tìm thấy {len(results)} trạm xăng")
+        matches = self.finder.find_in_radius(lat, lon, radius)
+        self.log(f"Tìm thấy {len(matches)} trạm xăng")
+        results = self.finder.nearest(matches, top_k=50)  # Limit to 50 stations
         
-        # Clear old markers
-        self.map_view.page().runJavaScript("clearStations();")
-        
-        # Show radius
-        self.map_view.page().runJavaScript(f"showRadius({lat}, {lon}, {radius});")
+        # Station markers, serialized as one JSON array
+        markers = []
+        for i, station in enumerate(results, 1):
+            s_lat, s_lon = station['coordinates']
+            dist = station['distance_km']
+            markers.append({
+                'lat': s_lat,
+                'lon': s_lon,
+                'name': station['name'],
+                'addr': f"{station.get('ward', '')}, {station.get('province', '')}",
+                'dist': dist
+            })
+            self.log(f"{i}. {station['name']} - {dist}km")
         
-        # Add selected point marker
+        # Clear old markers, show radius, add selected point and station markers in a single JS call
         self.map_view.page().runJavaScript(f"""
+            clearStations();
+            showRadius({lat}, {lon}, {radius});
             if (selectedMarker) map.removeLayer(selectedMarker);
             selectedMarker = L.marker([{lat}, {lon}], {{icon: redIcon}}).addTo(map);
             selectedMarker.bindPopup("<b>Vị trí tìm kiếm</b>").openPopup();
+            addStationsBatch({json.dumps(markers, ensure_ascii=False)});
         """)
         
-        # Add station markers
-        for i, station in enumerate(results[:50], 1):  # Limit to 50 stations
-            s_lat, s_lon = station['coordinates']
-            name = station['name'].replace("'", "\\'")
-            addr = f"{station.get('ward', '')}, {station.get('province', '')}".replace("'", "\\'")
-            dist = station['distance_km']
-            
-            self.map_view.page().runJavaScript(
-                f"addStation({s_lat}, {s_lon}, '{name}', '{addr}', {dist});"
-            )
-            
-            self.log(f"{i}. {station['name']} - {dist}km")
-        
-        if len(results) > 50:
-            self.log(f"(Hiển thị 50/{len(results)} trạm gần nhất)")
+        if len(matches) > 50:
+            self.log(f"(Hiển thị 50/{len(matches)} trạm gần nhất)")
     
     def clear_map(self):
         """Clear all markers"""
@@ -0,0 +1,106 @@
+"""
+Hàm khoảng cách và kernel Numba duyệt R-Tree đã làm phẳng của new_code_gui, tách riêng khỏi phần giao diện
+để build_rtree_native.py biên dịch được mà không cần PyQt5.
+"""
+import math
+from typing import Tuple
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Numba không bắt buộc, nếu chưa cài thì duyệt cây bằng Python
+    njit = None
+
+# Gắn sẵn các hàm của math ở mức module để haversine_distance không phải tra thuộc tính mỗi lần gọi
+_sin = math.sin
+_cos = math.cos
+_radians = math.radians
+_asin = math.asin
+_sqrt = math.sqrt
+
+def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
+    lat1, lon1 = coord1
+    lat2, lon2 = coord2
+    R = 6371
+    s_dlat = _sin(_radians(lat2 - lat1) * 0.5)
+    s_dlon = _sin(_radians(lon2 - lon1) * 0.5)
+    a = s_dlat * s_dlat + _cos(_radians(lat1)) * _cos(_radians(lat2)) * s_dlon * s_dlon
+    return R * 2 * _asin(_sqrt(a))
+
+def haversine_precomp(rad_clat, rad_clon, cos_clat, rad_lats, rad_lons, cos_lats):
+    """Haversine với radians/cos(lat) của trạm đã tính sẵn, chỉ còn sin của độ lệch và một arcsin/sqrt"""
+    R = 6371
+    a = (np.sin((rad_lats - rad_clat)/2)**2 + 
+         cos_clat * cos_lats * np.sin((rad_lons - rad_clon)/2)**2)
+    return 2 * R * np.arcsin(np.sqrt(a))
+
+# Với bán kính nhỏ, khoảng cách equirectangular sai lệch so với haversine dưới 2% nên
+# trạm có khoảng cách xấp xỉ vượt quá bán kính * FAST_REJECT_MARGIN chắc chắn nằm ngoài
+FAST_REJECT_MAX_RADIUS_KM = 50
+FAST_REJECT_MARGIN = 1.02
+KM_PER_DEG = 6371 * math.pi / 180
+
+def fast_dist_sq(rad_clat, rad_clon, cos_clat, rad_lats, rad_lons):
+    """Bình phương khoảng cách (km²) xấp xỉ equirectangular quanh tâm, không dùng hàm lượng giác"""
+    R = 6371
+    dy = (rad_lats - rad_clat) * R
+    dx = (rad_lons - rad_clon) * (cos_clat * R)
+    return dx * dx + dy * dy
+
+if njit is not None:
+    haversine_distance_jit = njit(cache=True)(haversine_distance)
+    haversine_precomp_jit = njit(cache=True)(haversine_precomp)
+    fast_dist_sq_jit = njit(cache=True)(fast_dist_sq)
+    
+    @njit(cache=True)
+    def rtree_search_jit(bboxes, children_start, children_count, is_leaf,
+                     point_rad_lat, point_rad_lon, point_cos_lat, clat, clon, radius_km):
+        """Duyệt cây đã làm phẳng (RTree.flatten) bằng stack mảng, trả về index và khoảng cách các trạm trong bán kính"""
+        center = (clat, clon)
+        rad_clat = math.radians(clat)
+        rad_clon = math.radians(clon)
+        cos_clat = math.cos(rad_clat)
+        fast_reject = radius_km <= FAST_REJECT_MAX_RADIUS_KM
+        reject_sq = (radius_km * FAST_REJECT_MARGIN) ** 2
+        kx = KM_PER_DEG * cos_clat
+        stack = np.empty(bboxes.shape[0], dtype=np.int64)
+        ids = np.empty(point_rad_lat.size, dtype=np.int64)
+        distances = np.empty(point_rad_lat.size, dtype=np.float64)
+        stack[0] = 0
+        sp = 1
+        k = 0
+        while sp > 0:
+            sp -= 1
+            i = stack[sp]
+            if children_count[i] == 0:
+                continue
+            # Điểm gần tâm nhất trong bbox
+            closest_lat = max(bboxes[i, 0], min(clat, bboxes[i, 1]))
+            closest_lon = max(bboxes[i, 2], min(clon, bboxes[i, 3]))
+            if fast_reject:
+                dy = (closest_lat - clat) * KM_PER_DEG
+                dx = (closest_lon - clon) * kx
+                if dx * dx + dy * dy > reject_sq:
+                    continue
+            elif haversine_distance_jit(center, (closest_lat, closest_lon)) > radius_km:
+                continue
+            start = children_start[i]
+            if is_leaf[i]:
+                for j in range(start, start + children_count[i]):
+                    if fast_reject and fast_dist_sq_jit(rad_clat, rad_clon, cos_clat,
+                                                        point_rad_lat[j], point_rad_lon[j]) > reject_sq:
+                        continue
+                    dist = haversine_precomp_jit(rad_clat, rad_clon, cos_clat,
+                                                 point_rad_lat[j], point_rad_lon[j], point_cos_lat[j])
+                    if dist <= radius_km:
+                        ids[k] = j
+                        distances[k] = dist
+                        k += 1
+            else:
+                # Đưa con vào stack theo thứ tự ngược để duyệt giống _search
+                for c in range(children_count[i] - 1, -1, -1):
+                    stack[sp] = start + c
+                    sp += 1
+        return ids[:k], distances[:k]
+else:
+    rtree_search_jit = None
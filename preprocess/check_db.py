@@ -1,20 +1,21 @@
-f = open("db.json", "r", encoding="utf-8")
-
 import json
 
+try:
+    import orjson
+except ImportError:  # orjson không bắt buộc, nếu chưa cài thì dùng json chuẩn
+    orjson = None
 
-data = json.load(f)
-
-ward_unique = []
-province_unique = []
 
+if orjson is not None:
+    with open("db.json", "rb") as f:
+        data = orjson.loads(f.read())
+else:
+    with open("db.json", "r", encoding="utf-8") as f:
+        data = json.load(f)
 
-for item in data:
-    if(item["ward"] not in ward_unique):
-        ward_unique.append(item["ward"])
-
-    if(item["province"] not in province_unique):
-        province_unique.append(item["province"])
+# dict.fromkeys khử trùng lặp trong O(n) mà vẫn giữ thứ tự xuất hiện
+ward_unique = list(dict.fromkeys(item["ward"] for item in data))
+province_unique = list(dict.fromkeys(item["province"] for item in data))
 
 
 
@@ -1,8 +1,12 @@
 import json
 import numpy as np
 from math import radians, sin, cos, sqrt, asin
+import bisect
 import heapq
-import itertools
+try:
+    import ijson
+except ImportError:  # ijson không bắt buộc, nếu chưa cài thì đọc cả file bằng json
+    ijson = None
 
 # Hàm tính khoảng cách Haversine (km)
 def haversine(lon1, lat1, lon2, lat2):
@@ -16,154 +20,208 @@ def haversine(lon1, lat1, lon2, lat2):
 
 # Triển khai R-Tree đơn giản tự viết (cho 2D points)
 class RTreeNode:
-    def __init__(self, is_leaf=False):
+    __slots__ = ('is_leaf', 'entries', 'min_lon', 'min_lat', 'max_lon', 'max_lat', 'node_id')
+
+    def __init__(self, is_leaf=False, node_id=0):
         self.is_leaf = is_leaf
-        self.entries = []  # (mbr, child or data_id)
-        self.mbr = None
+        self.node_id = node_id  # chỉ số của node trong RTree._node_table
+        self.entries = []  # (min_lon, min_lat, max_lon, max_lat, child or data_id)
+        # MBR lưu thành 4 số thực ngay trên node thay vì một tuple
+        self.min_lon = self.min_lat = self.max_lon = self.max_lat = None
 
     def update_mbr(self):
         if not self.entries:
-            self.mbr = None
+            self.min_lon = self.min_lat = self.max_lon = self.max_lat = None
             return
-        min_lon = min(e[0][0] for e in self.entries)
-        min_lat = min(e[0][1] for e in self.entries)
-        max_lon = max(e[0][2] for e in self.entries)
-        max_lat = max(e[0][3] for e in self.entries)
-        self.mbr = (min_lon, min_lat, max_lon, max_lat)
+        self.min_lon = min(e[0] for e in self.entries)
+        self.min_lat = min(e[1] for e in self.entries)
+        self.max_lon = max(e[2] for e in self.entries)
+        self.max_lat = max(e[3] for e in self.entries)
+
+    def entry(self):
+        return (self.min_lon, self.min_lat, self.max_lon, self.max_lat, self)
 
 class RTree:
     def __init__(self, max_entries=4, min_entries=2):
-        self.root = RTreeNode(is_leaf=True)
+        self._node_table = []  # mọi node đã tạo, đánh số theo node_id
+        self.root = self._new_node(is_leaf=True)
         self.max_entries = max_entries
         self.min_entries = min_entries
 
-    def _choose_subtree(self, node, mbr):
+    def _new_node(self, is_leaf=False):
+        node = RTreeNode(is_leaf=is_leaf, node_id=len(self._node_table))
+        self._node_table.append(node)
+        return node
+
+    def _choose_subtree(self, node, min_lon, min_lat, max_lon, max_lat):
+        enlargement = self._enlargement
         best_enlargement = float('inf')
-        best_child = None
-        for entry in node.entries:
-            enl = self._enlargement(entry[0], mbr)
+        best_index = None
+        for i, (e_min_lon, e_min_lat, e_max_lon, e_max_lat, _) in enumerate(node.entries):
+            enl = enlargement(e_min_lon, e_min_lat, e_max_lon, e_max_lat,
+                              min_lon, min_lat, max_lon, max_lat)
             if enl < best_enlargement:
                 best_enlargement = enl
-                best_child = entry[1]
-        return best_child
-
-    def _enlargement(self, mbr1, mbr2):
-        min_lon = min(mbr1[0], mbr2[0])
-        min_lat = min(mbr1[1], mbr2[1])
-        max_lon = max(mbr1[2], mbr2[2])
-        max_lat = max(mbr1[3], mbr2[3])
+                best_index = i
+        return best_index
+
+    def _enlargement(self, a_min_lon, a_min_lat, a_max_lon, a_max_lat,
+                     b_min_lon, b_min_lat, b_max_lon, b_max_lat):
+        min_lon = a_min_lon if a_min_lon < b_min_lon else b_min_lon
+        min_lat = a_min_lat if a_min_lat < b_min_lat else b_min_lat
+        max_lon = a_max_lon if a_max_lon > b_max_lon else b_max_lon
+        max_lat = a_max_lat if a_max_lat > b_max_lat else b_max_lat
         new_area = (max_lon - min_lon) * (max_lat - min_lat)
-        old_area = (mbr1[2] - mbr1[0]) * (mbr1[3] - mbr1[1])
+        old_area = (a_max_lon - a_min_lon) * (a_max_lat - a_min_lat)
         return new_area - old_area
 
     def _split(self, node):
         # Simple linear split
-        if (node.mbr[2] - node.mbr[0]) > (node.mbr[3] - node.mbr[1]):
+        if (node.max_lon - node.min_lon) > (node.max_lat - node.min_lat):
             axis = 0  # lon
         else:
             axis = 1  # lat
-        node.entries.sort(key=lambda e: (e[0][axis] + e[0][axis+2]) / 2)
+        node.entries.sort(key=lambda e: (e[axis] + e[axis+2]) / 2)
         mid = len(node.entries) // 2
-        new_node = RTreeNode(is_leaf=node.is_leaf)
+        new_node = self._new_node(is_leaf=node.is_leaf)
         new_node.entries = node.entries[mid:]
         node.entries = node.entries[:mid]
         node.update_mbr()
         new_node.update_mbr()
         return new_node
 
-    def _insert(self, node, mbr, data_id):
+    def _insert(self, node, entry):
+        entries = node.entries
         if node.is_leaf:
-            node.entries.append((mbr, data_id))
+            entries.append(entry)
             node.update_mbr()
         else:
-            child = self._choose_subtree(node, mbr)
-            new_child = self._insert(child, mbr, data_id)
+            i = self._choose_subtree(node, *entry[:4])
+            child = entries[i][4]
+            new_child = self._insert(child, entry)
+            # MBR của child đã thay đổi (nới ra khi thêm điểm hoặc thu lại khi split), cập nhật entry của nó
+            entries[i] = child.entry()
             if new_child:
-                node.entries.append((new_child.mbr, new_child))
-                node.update_mbr()
-        if len(node.entries) > self.max_entries:
+                entries.append(new_child.entry())
+            node.update_mbr()
+        if len(entries) > self.max_entries:
             return self._split(node)
         return None
 
     def insert(self, point, data_id):
-        mbr = (point[0], point[1], point[0], point[1])
-        new_root_child = self._insert(self.root, mbr, data_id)
+        new_root_child = self._insert(self.root, (point[0], point[1], point[0], point[1], data_id))
         if new_root_child:
-            new_root = RTreeNode()
-            new_root.entries = [(self.root.mbr, self.root), (new_root_child.mbr, new_root_child)]
+            new_root = self._new_node()
+            new_root.entries = [self.root.entry(), new_root_child.entry()]
             new_root.update_mbr()
             self.root = new_root
 
     def intersection(self, query_mbr):
+        # Duyệt bằng stack, kiểm tra giao MBR bằng 4 số thực viết thẳng trong vòng lặp
         results = []
-        self._intersection(self.root, query_mbr, results)
+        q_min_lon, q_min_lat, q_max_lon, q_max_lat = query_mbr
+        stack = [self.root]
+        pop, push_all, extend = stack.pop, stack.extend, results.extend
+        while stack:
+            node = pop()
+            overlapping = [item for min_lon, min_lat, max_lon, max_lat, item in node.entries
+                           if not (max_lon < q_min_lon or min_lon > q_max_lon or
+                                   max_lat < q_min_lat or min_lat > q_max_lat)]
+            if node.is_leaf:
+                extend(overlapping)
+            else:
+                # Đảo ngược để node con được duyệt theo đúng thứ tự như bản đệ quy
+                push_all(reversed(overlapping))
         return results
 
-    def _intersection(self, node, query_mbr, results):
-        for mbr, item in node.entries:
-            if self._overlaps(mbr, query_mbr):
-                if node.is_leaf:
-                    results.append(item)
-                else:
-                    self._intersection(item, query_mbr, results)
-
-    def _overlaps(self, mbr1, mbr2):
-        return not (mbr1[2] < mbr2[0] or mbr1[0] > mbr2[2] or mbr1[3] < mbr2[1] or mbr1[1] > mbr2[3])
-
-    def _mbr_distance(self, point, mbr):
+    def _mbr_distance(self, point, min_lon, min_lat, max_lon, max_lat):
         lon, lat = point
-        closest_lon = max(mbr[0], min(lon, mbr[2]))
-        closest_lat = max(mbr[1], min(lat, mbr[3]))
+        closest_lon = max(min_lon, min(lon, max_lon))
+        closest_lat = max(min_lat, min(lat, max_lat))
         return haversine(lon, lat, closest_lon, closest_lat)
 
     def nearest(self, point, k=1):
-        pq = []
-        counter = itertools.count()
-        heapq.heappush(pq, (0, next(counter), self.root))
+        # Heap chỉ chứa (khoảng cách, mã int): bit thấp 1 là node (mã >> 1 là node_id), bit thấp 0 là
+        # data_id (mã >> 1, data_id là số nguyên không âm), nên không cần bộ đếm để phá hoà.
+        # bound là khoảng cách data thứ k nhỏ nhất đã push: entry xa hơn không thể vào top k nên bỏ qua
+        if k <= 0:
+            return []
+        push, pop, insort = heapq.heappush, heapq.heappop, bisect.insort
+        mbr_distance = self._mbr_distance
+        node_table = self._node_table
+        pq = [(0, self.root.node_id << 1 | 1)]
+        data_dists = []  # tối đa k khoảng cách data nhỏ nhất đã push, tăng dần
+        bound = float('inf')
         results = []
         while pq and len(results) < k:
-            dist, _, item = heapq.heappop(pq)
-            if isinstance(item, RTreeNode):
-                node = item
-                for mbr, child_or_id in node.entries:
-                    mbr_dist = self._mbr_distance(point, mbr)
-                    if node.is_leaf:
-                        heapq.heappush(pq, (mbr_dist, next(counter), child_or_id))
-                    else:
-                        heapq.heappush(pq, (mbr_dist, next(counter), child_or_id))
+            dist, code = pop(pq)
+            if not code & 1:
+                results.append(code >> 1)
+                continue
+            node = node_table[code >> 1]
+            if node.is_leaf:
+                for min_lon, min_lat, max_lon, max_lat, data_id in node.entries:
+                    d = mbr_distance(point, min_lon, min_lat, max_lon, max_lat)
+                    if d <= bound:
+                        push(pq, (d, data_id << 1))
+                        insort(data_dists, d)
+                        if len(data_dists) > k:
+                            data_dists.pop()
+                        if len(data_dists) == k:
+                            bound = data_dists[-1]
             else:
-                # item is data_id
-                results.append(item)
+                for min_lon, min_lat, max_lon, max_lat, child in node.entries:
+                    d = mbr_distance(point, min_lon, min_lat, max_lon, max_lat)
+                    if d <= bound:
+                        push(pq, (d, child.node_id << 1 | 1))
         return results
 
+# Lần lượt từng feature của file GeoJSON: có ijson thì đọc dạng stream, không dựng cả cây dict/list trong bộ nhớ
+def iter_features(filename):
+    if ijson is not None:
+        with open(filename, 'rb') as f:
+            yield from ijson.items(f, 'features.item', use_float=True)
+    else:
+        with open(filename, 'r', encoding='utf-8') as f:
+            yield from json.load(f)['features']
+
 # Đọc và parse dữ liệu từ GeoJSON
 def load_geojson(filename='export.geojson'):
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
+    # Mỗi Polygon chỉ giữ ring ngoài (mảng NumPy) và các thuộc tính cần dùng,
+    # feature đọc từ stream được bỏ ngay thay vì giữ lại cả danh sách feature
+    rings = []
     stations = []
-    for i, feature in enumerate(data['features']):
-        if feature['geometry']['type'] == 'Polygon':
-            # Tính centroid từ coordinates[0] (outer ring của Polygon)
-            coords = np.array(feature['geometry']['coordinates'][0])
-            centroid_lon = np.mean(coords[:, 0])
-            centroid_lat = np.mean(coords[:, 1])
-            
-            props = feature['properties']
-            name = props.get('name', 'Trạm xăng không tên')
-            brand = props.get('brand', 'Không rõ')
-            note = props.get('note', '')  # Nếu có trường note
-            at_id = props.get('@id', 'Không có')  # Thêm @id
-            
-            stations.append({
-                'id': i,
-                'name': name,
-                'brand': brand,
-                'note': note,
-                'lat': centroid_lat,
-                'lon': centroid_lon,
-                'at_id': at_id
-            })
+    for i, feature in enumerate(iter_features(filename)):
+        if feature['geometry']['type'] != 'Polygon':
+            continue
+        rings.append(np.asarray(feature['geometry']['coordinates'][0], dtype=np.float64).reshape(-1, 2))
+        props = feature['properties']
+        name = props.get('name', 'Trạm xăng không tên')
+        brand = props.get('brand', 'Không rõ')
+        note = props.get('note', '')  # Nếu có trường note
+        at_id = props.get('@id', 'Không có')  # Thêm @id
+        
+        stations.append({
+            'id': i,
+            'name': name,
+            'brand': brand,
+            'note': note,
+            'lat': 0.0,
+            'lon': 0.0,
+            'at_id': at_id
+        })
+    
+    # Tính centroid từ coordinates[0] (outer ring của Polygon) cho tất cả Polygon cùng lúc:
+    # nối các ring thành một mảng rồi cộng theo từng đoạn bằng np.add.reduceat
+    lengths = np.array([len(ring) for ring in rings], dtype=np.int64)
+    centroids = np.empty((0, 2))
+    if rings:
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        centroids = np.add.reduceat(np.concatenate(rings), starts) / lengths[:, None]
+    
+    for station, (centroid_lon, centroid_lat) in zip(stations, centroids.tolist()):
+        station['lat'] = centroid_lat
+        station['lon'] = centroid_lon
     
     print(f'Đã tải {len(stations)} trạm xăng từ file {filename}.')
     return stations
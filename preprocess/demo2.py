@@ -1,9 +1,17 @@
 import json
+import math
 import numpy as np
 from math import radians, sin, cos, sqrt, asin
-import heapq
-import itertools
+import bisect
+try:
+    import ijson
+except ImportError:  # ijson không bắt buộc, nếu chưa cài thì đọc cả file bằng json
+    ijson = None
 import sys
+try:
+    from numba import njit
+except ImportError:  # Numba không bắt buộc, nếu chưa cài thì truy vấn bằng NumPy
+    njit = None
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLineEdit, QLabel, QHBoxLayout
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 from PyQt5.QtWebChannel import QWebChannel
@@ -20,155 +28,373 @@ def haversine(lon1, lat1, lon2, lat2):
     r = 6371  # Bán kính Trái Đất (km)
     return c * r
 
-# Triển khai R-Tree đơn giản tự viết (cho 2D points)
-class RTreeNode:
-    def __init__(self, is_leaf=False):
-        self.is_leaf = is_leaf
-        self.entries = []  # (mbr, child or data_id)
-        self.mbr = None
-
-    def update_mbr(self):
-        if not self.entries:
-            self.mbr = None
-            return
-        min_lon = min(e[0][0] for e in self.entries)
-        min_lat = min(e[0][1] for e in self.entries)
-        max_lon = max(e[0][2] for e in self.entries)
-        max_lat = max(e[0][3] for e in self.entries)
-        self.mbr = (min_lon, min_lat, max_lon, max_lat)
+# Haversine từ một điểm tới mảng các điểm (km), tính cùng lúc bằng NumPy
+def haversine_vec(lon1, lat1, lons, lats):
+    lon1, lat1 = radians(lon1), radians(lat1)
+    lons, lats = np.radians(lons), np.radians(lats)
+    dlon = lons - lon1
+    dlat = lats - lat1
+    a = np.sin(dlat / 2)**2 + cos(lat1) * np.cos(lats) * np.sin(dlon / 2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    r = 6371  # Bán kính Trái Đất (km)
+    return c * r
 
+# Haversine (km) khi toạ độ các điểm đã được đổi sang radian và có sẵn cos(vĩ độ), chỉ điểm gốc cần đổi mỗi lần
+def haversine_precomp(rad_lon1, rad_lat1, cos_lat1, rad_lons, rad_lats, cos_lats):
+    # Tính tại chỗ trên hai mảng tạm thay vì tạo mảng mới sau mỗi phép toán
+    a = np.subtract(rad_lats, rad_lat1)
+    a *= 0.5
+    np.sin(a, out=a)
+    a *= a
+    b = np.subtract(rad_lons, rad_lon1)
+    b *= 0.5
+    np.sin(b, out=b)
+    b *= b
+    b *= cos_lats
+    b *= cos_lat1
+    a += b
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * 6371
+    return a
+
+# "Cheap ruler": km trên mỗi độ kinh/vĩ, đủ chính xác trong vài chục km để loại nhanh trạm ở xa
+CHEAP_RULER_KX = 111.320  # nhân thêm cos(vĩ độ người dùng)
+CHEAP_RULER_KY = 110.574
+CHEAP_RULER_MAX_RADIUS_KM = 50  # bán kính lớn hơn thì sai số không còn an toàn, chỉ dùng haversine
+CHEAP_RULER_MARGIN = 1.02  # nới bán kính 2% để bù sai số, loại nhanh không bao giờ bỏ sót trạm
+
+# Không có Numba thì dưới ngưỡng này truy vấn bán kính quét tuyến tính thay vì duyệt cây
+LINEAR_SCAN_MAX_POINTS = 50000
+
+# Bình phương bán kính dùng để loại nhanh bằng cheap ruler (vô cực khi bán kính quá lớn)
+def cheap_ruler_reject_sq(radius_km):
+    if radius_km > CHEAP_RULER_MAX_RADIUS_KM:
+        return math.inf
+    return (radius_km * CHEAP_RULER_MARGIN) ** 2
+
+if njit is not None:
+    # Lọc các điểm của một node lá: bbox, cheap ruler rồi haversine; ghi vào out_idx/out_dist từ vị trí n_out.
+    # inside: MBR của lá nằm trọn trong hình tròn nên bỏ qua bbox và cheap ruler, chỉ còn haversine.
+    # fastmath bỏ cờ ninf/nnan vì reject_sq có thể là vô cực
+    @njit(cache=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'})
+    def _query_leaf(start, end, inside, point_lon, point_lat, point_rad_lon, point_rad_lat, point_cos_lat,
+                    query_box, ulon, ulat, rad_ulon, rad_ulat, cos_ulat, kx, r_km, reject_sq,
+                    out_idx, out_dist, n_out):
+        q_min_lon, q_min_lat, q_max_lon, q_max_lat = query_box
+        for j in range(start, end):
+            if not inside:
+                lon = point_lon[j]
+                lat = point_lat[j]
+                if lon < q_min_lon or lon > q_max_lon or lat < q_min_lat or lat > q_max_lat:
+                    continue
+                # Loại nhanh bằng khoảng cách phẳng, chỉ tính haversine cho trạm có thể nằm trong bán kính
+                dx = (lon - ulon) * kx
+                dy = (lat - ulat) * CHEAP_RULER_KY
+                if dx * dx + dy * dy > reject_sq:
+                    continue
+            a = (math.sin((point_rad_lat[j] - rad_ulat) / 2) ** 2 +
+                 cos_ulat * point_cos_lat[j] * math.sin((point_rad_lon[j] - rad_ulon) / 2) ** 2)
+            d = 2 * math.asin(math.sqrt(a)) * 6371
+            if d <= r_km:
+                out_idx[n_out] = j
+                out_dist[n_out] = d
+                n_out += 1
+        return n_out
+
+    # Duyệt cây đã làm phẳng trong một vòng lặp biên dịch, stack là mảng int cấp sẵn và chỉ chứa node trong;
+    # con của một node hoặc đều là lá (gọi thẳng _query_leaf) hoặc đều là node trong, nên chỉ rẽ nhánh một lần mỗi node.
+    # Lá có góc xa nhất cách điểm truy vấn không quá sqrt(inner_sq) (cheap ruler) được coi là nằm trọn trong hình tròn
+    @njit(cache=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'})
+    def query_radius(mbrs, starts, counts, n_leaf_nodes, point_lon, point_lat,
+                     point_rad_lon, point_rad_lat, point_cos_lat, ulon, ulat, r_km, r_deg_lon, r_deg_lat,
+                     reject_sq, inner_sq, stack_size):
+        q_min_lon, q_max_lon = ulon - r_deg_lon, ulon + r_deg_lon
+        q_min_lat, q_max_lat = ulat - r_deg_lat, ulat + r_deg_lat
+        query_box = (q_min_lon, q_min_lat, q_max_lon, q_max_lat)
+        rad_ulon, rad_ulat = math.radians(ulon), math.radians(ulat)
+        cos_ulat = math.cos(rad_ulat)
+        kx = CHEAP_RULER_KX * cos_ulat
+        out_idx = np.empty(len(point_lon), dtype=np.int64)
+        out_dist = np.empty(len(point_lon), dtype=np.float64)
+        n_out = 0
+        root = len(mbrs) - 1
+        if root < 0 or (mbrs[root, 2] < q_min_lon or mbrs[root, 0] > q_max_lon or
+                        mbrs[root, 3] < q_min_lat or mbrs[root, 1] > q_max_lat):
+            return out_idx[:0], out_dist[:0]
+        if root < n_leaf_nodes:
+            n_out = _query_leaf(starts[root], starts[root] + counts[root], False, point_lon, point_lat,
+                                point_rad_lon, point_rad_lat, point_cos_lat, query_box, ulon, ulat,
+                                rad_ulon, rad_ulat, cos_ulat, kx, r_km, reject_sq, out_idx, out_dist, n_out)
+            return out_idx[:n_out], out_dist[:n_out]
+        stack = np.empty(stack_size, dtype=np.int32)
+        stack[0] = root
+        top = 1
+        while top > 0:
+            top -= 1
+            node = stack[top]
+            start = starts[node]
+            end = start + counts[node]
+            leaf_children = start < n_leaf_nodes
+            for child in range(start, end):
+                if (mbrs[child, 2] < q_min_lon or mbrs[child, 0] > q_max_lon or
+                        mbrs[child, 3] < q_min_lat or mbrs[child, 1] > q_max_lat):
+                    continue
+                if leaf_children:
+                    far_dx = max(abs(mbrs[child, 0] - ulon), abs(mbrs[child, 2] - ulon)) * kx
+                    far_dy = max(abs(mbrs[child, 1] - ulat), abs(mbrs[child, 3] - ulat)) * CHEAP_RULER_KY
+                    inside = far_dx * far_dx + far_dy * far_dy <= inner_sq
+                    n_out = _query_leaf(starts[child], starts[child] + counts[child], inside, point_lon, point_lat,
+                                        point_rad_lon, point_rad_lat, point_cos_lat, query_box, ulon, ulat,
+                                        rad_ulon, rad_ulat, cos_ulat, kx, r_km, reject_sq, out_idx, out_dist, n_out)
+                else:
+                    stack[top] = child
+                    top += 1
+        return out_idx[:n_out], out_dist[:n_out]
+else:
+    query_radius = None
+
+# Làm tròn MBR float64 ra float32 theo hướng nới rộng để không bỏ sót điểm nằm sát biên
+def _mbrs_float32(mbrs):
+    lo = mbrs[:, :2].astype(np.float32)
+    lo = np.where(lo > mbrs[:, :2], np.nextafter(lo, np.float32(-np.inf)), lo)
+    hi = mbrs[:, 2:].astype(np.float32)
+    hi = np.where(hi < mbrs[:, 2:], np.nextafter(hi, np.float32(np.inf)), hi)
+    return np.hstack([lo, hi])
+
+# Mở rộng các đoạn [start, start + count) thành một mảng chỉ số liền nhau
+def _expand_ranges(starts, counts):
+    total = int(counts.sum())
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + (np.arange(total) - offsets)
+
+# Triển khai R-Tree đơn giản tự viết (cho 2D points), lưu dạng mảng theo từng tầng
 class RTree:
-    def __init__(self, max_entries=4, min_entries=2):
-        self.root = RTreeNode(is_leaf=True)
+    def __init__(self, max_entries=4):
         self.max_entries = max_entries
-        self.min_entries = min_entries
-
-    def _choose_subtree(self, node, mbr):
-        best_enlargement = float('inf')
-        best_child = None
-        for entry in node.entries:
-            enl = self._enlargement(entry[0], mbr)
-            if enl < best_enlargement:
-                best_enlargement = enl
-                best_child = entry[1]
-        return best_child
-
-    def _enlargement(self, mbr1, mbr2):
-        min_lon = min(mbr1[0], mbr2[0])
-        min_lat = min(mbr1[1], mbr2[1])
-        max_lon = max(mbr1[2], mbr2[2])
-        max_lat = max(mbr1[3], mbr2[3])
-        new_area = (max_lon - min_lon) * (max_lat - min_lat)
-        old_area = (mbr1[2] - mbr1[0]) * (mbr1[3] - mbr1[1])
-        return new_area - old_area
-
-    def _split(self, node):
-        # Simple linear split
-        if (node.mbr[2] - node.mbr[0]) > (node.mbr[3] - node.mbr[1]):
-            axis = 0  # lon
-        else:
-            axis = 1  # lat
-        node.entries.sort(key=lambda e: (e[0][axis] + e[0][axis+2]) / 2)
-        mid = len(node.entries) // 2
-        new_node = RTreeNode(is_leaf=node.is_leaf)
-        new_node.entries = node.entries[mid:]
-        node.entries = node.entries[:mid]
-        node.update_mbr()
-        new_node.update_mbr()
-        return new_node
-
-    def _insert(self, node, mbr, data_id):
-        if node.is_leaf:
-            node.entries.append((mbr, data_id))
-            node.update_mbr()
+        # Các điểm theo thứ tự đóng gói: toạ độ gốc (float64) và data_id
+        self.point_lon = np.empty(0, dtype=np.float64)
+        self.point_lat = np.empty(0, dtype=np.float64)
+        # Radian và cos(vĩ độ) của các điểm, tính một lần khi xây cây để truy vấn không phải đổi lại
+        self.point_rad_lon = np.empty(0, dtype=np.float64)
+        self.point_rad_lat = np.empty(0, dtype=np.float64)
+        self.point_cos_lat = np.empty(0, dtype=np.float64)
+        self.point_ids = np.empty(0, dtype=np.int64)
+        # level_mbrs[l]: mảng float32 (n, 4) [min_lon, min_lat, max_lon, max_lat] của các node tầng l
+        # (tầng 0 là node lá, tầng cuối là root); con của node j là đoạn
+        # [level_starts[l][j], level_starts[l][j] + level_counts[l][j]) ở tầng l - 1 (hoặc mảng điểm)
+        self.level_mbrs = []
+        self.level_starts = []
+        self.level_counts = []
+        # Các tầng nối liền thành một mảng (root ở cuối) cho kernel Numba, tạo lại sau mỗi lần bulk_load
+        self.flat = None
+
+    def _str_order(self, lons, lats):
+        # Chia thành các lát theo lon, trong mỗi lát sắp theo lat (Sort-Tile-Recursive)
+        M = self.max_entries
+        num_slices = max(1, math.ceil(math.sqrt(math.ceil(len(lons) / M))))
+        slice_size = num_slices * M
+        order = np.argsort(lons, kind='stable')
+        for i in range(0, len(order), slice_size):
+            part = order[i:i + slice_size]
+            order[i:i + slice_size] = part[np.argsort(lats[part], kind='stable')]
+        return order
+
+    def bulk_load(self, points, ids):
+        # Xây cả cây một lần bằng STR, mỗi tầng là các mảng liền nhau thay vì node/tuple
+        M = self.max_entries
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        ids = np.asarray(ids, dtype=np.int64)
+        order = self._str_order(coords[:, 0], coords[:, 1])
+        self.point_lon = coords[order, 0]
+        self.point_lat = coords[order, 1]
+        self.point_rad_lon = np.radians(self.point_lon)
+        self.point_rad_lat = np.radians(self.point_lat)
+        self.point_cos_lat = np.cos(self.point_rad_lat)
+        self.point_ids = ids[order]
+        self.level_mbrs, self.level_starts, self.level_counts = [], [], []
+
+        mbrs = np.column_stack([self.point_lon, self.point_lat, self.point_lon, self.point_lat])
+        # Gom dần các entry thành tầng trên cho tới khi chỉ còn root
+        while len(mbrs) > 0:
+            starts = np.arange(0, len(mbrs), M)
+            counts = np.minimum(M, len(mbrs) - starts)
+            mbrs = np.column_stack([np.minimum.reduceat(mbrs[:, 0], starts),
+                                    np.minimum.reduceat(mbrs[:, 1], starts),
+                                    np.maximum.reduceat(mbrs[:, 2], starts),
+                                    np.maximum.reduceat(mbrs[:, 3], starts)])
+            if len(mbrs) > 1:
+                # Sắp các node vừa tạo theo STR để tầng trên gom được các node gần nhau
+                order = self._str_order(mbrs[:, 0] + mbrs[:, 2], mbrs[:, 1] + mbrs[:, 3])
+                mbrs, starts, counts = mbrs[order], starts[order], counts[order]
+            self.level_mbrs.append(_mbrs_float32(mbrs))
+            self.level_starts.append(starts.astype(np.int32))
+            self.level_counts.append(counts.astype(np.int32))
+            if len(mbrs) == 1:
+                break
+        self.flat = None
+
+    def flatten(self):
+        # Nối các tầng thành (mbrs, starts, counts, n_leaf_nodes); starts của node trong được đổi
+        # thành chỉ số tuyệt đối trong mảng nối, starts của node lá vẫn trỏ vào mảng điểm
+        bases = np.cumsum([0] + [len(m) for m in self.level_mbrs])
+        mbrs = np.concatenate(self.level_mbrs) if self.level_mbrs else np.empty((0, 4), dtype=np.float32)
+        starts = np.concatenate([self.level_starts[0]] +
+                                [s + bases[l - 1] for l, s in enumerate(self.level_starts) if l > 0]
+                                ).astype(np.int32) if self.level_starts else np.empty(0, dtype=np.int32)
+        counts = np.concatenate(self.level_counts) if self.level_counts else np.empty(0, dtype=np.int32)
+        n_leaf_nodes = len(self.level_mbrs[0]) if self.level_mbrs else 0
+        self.flat = (mbrs, starts, counts, n_leaf_nodes)
+        return self.flat
+
+    def query_radius(self, lon, lat, radius_km, deg_lon, deg_lat):
+        # Các cặp (data_id, khoảng cách km) trong bán kính, chưa sắp xếp; hộp truy vấn lệch deg_lon/deg_lat quanh điểm
+        if query_radius is not None:
+            if self.flat is None:
+                self.flatten()
+            mbrs, starts, counts, n_leaf_nodes = self.flat
+            stack_size = len(self.level_mbrs) * self.max_entries + 1
+            idx, dists = query_radius(mbrs, starts, counts, n_leaf_nodes, self.point_lon, self.point_lat,
+                                      self.point_rad_lon, self.point_rad_lat, self.point_cos_lat,
+                                      lon, lat, radius_km, deg_lon, deg_lat,
+                                      cheap_ruler_reject_sq(radius_km), (radius_km / CHEAP_RULER_MARGIN) ** 2,
+                                      stack_size)
+            return self.point_ids[idx], dists
+
+        if len(self.point_lon) < LINEAR_SCAN_MAX_POINTS:
+            # Ít điểm: quét thẳng toàn bộ mảng điểm một lượt nhanh hơn duyệt cây theo tầng bằng NumPy
+            pos = np.arange(len(self.point_lon))
         else:
-            child = self._choose_subtree(node, mbr)
-            new_child = self._insert(child, mbr, data_id)
-            if new_child:
-                node.entries.append((new_child.mbr, new_child))
-                node.update_mbr()
-        if len(node.entries) > self.max_entries:
-            return self._split(node)
-        return None
-
-    def insert(self, point, data_id):
-        mbr = (point[0], point[1], point[0], point[1])
-        new_root_child = self._insert(self.root, mbr, data_id)
-        if new_root_child:
-            new_root = RTreeNode()
-            new_root.entries = [(self.root.mbr, self.root), (new_root_child.mbr, new_root_child)]
-            new_root.update_mbr()
-            self.root = new_root
+            pos = self._intersection_positions((lon - deg_lon, lat - deg_lat, lon + deg_lon, lat + deg_lat))
+        # Loại nhanh bằng cheap ruler, rồi tính haversine một lần cho các ứng viên còn lại
+        dx = (self.point_lon[pos] - lon) * (CHEAP_RULER_KX * cos(radians(lat)))
+        dy = (self.point_lat[pos] - lat) * CHEAP_RULER_KY
+        pos = pos[dx * dx + dy * dy <= cheap_ruler_reject_sq(radius_km)]
+        rad_lat = radians(lat)
+        dists = haversine_precomp(radians(lon), rad_lat, cos(rad_lat), self.point_rad_lon[pos],
+                                  self.point_rad_lat[pos], self.point_cos_lat[pos])
+        inside = dists <= radius_km
+        return self.point_ids[pos[inside]], dists[inside]
 
     def intersection(self, query_mbr):
-        results = []
-        self._intersection(self.root, query_mbr, results)
-        return results
-
-    def _intersection(self, node, query_mbr, results):
-        for mbr, item in node.entries:
-            if self._overlaps(mbr, query_mbr):
-                if node.is_leaf:
-                    results.append(item)
-                else:
-                    self._intersection(item, query_mbr, results)
-
-    def _overlaps(self, mbr1, mbr2):
-        return not (mbr1[2] < mbr2[0] or mbr1[0] > mbr2[2] or mbr1[3] < mbr2[1] or mbr1[1] > mbr2[3])
-
-    def _mbr_distance(self, point, mbr):
-        lon, lat = point
-        closest_lon = max(mbr[0], min(lon, mbr[2]))
-        closest_lat = max(mbr[1], min(lat, mbr[3]))
-        return haversine(lon, lat, closest_lon, closest_lat)
+        return self.point_ids[self._intersection_positions(query_mbr)].tolist()
+
+    def _intersection_positions(self, query_mbr):
+        # Duyệt từng tầng từ root xuống, kiểm tra giao MBR cho cả tầng cùng lúc; trả về vị trí trong mảng điểm
+        if not self.level_mbrs:
+            return np.empty(0, dtype=np.int64)
+        q_min_lon, q_min_lat, q_max_lon, q_max_lat = query_mbr
+        nodes = np.zeros(1, dtype=np.int64)
+        for level in range(len(self.level_mbrs) - 1, -1, -1):
+            mbrs = self.level_mbrs[level][nodes]
+            overlap = ~((mbrs[:, 2] < q_min_lon) | (mbrs[:, 0] > q_max_lon) |
+                        (mbrs[:, 3] < q_min_lat) | (mbrs[:, 1] > q_max_lat))
+            nodes = nodes[np.nonzero(overlap)[0]]
+            nodes = _expand_ranges(self.level_starts[level][nodes], self.level_counts[level][nodes])
+        # Ở tầng điểm so với toạ độ gốc
+        lons = self.point_lon[nodes]
+        lats = self.point_lat[nodes]
+        inside = (lons >= q_min_lon) & (lons <= q_max_lon) & (lats >= q_min_lat) & (lats <= q_max_lat)
+        return nodes[inside]
+
+    def _nearest_nodes(self, level, idx, lon, lat):
+        # Khoảng cách tới điểm gần nhất trên MBR của từng node con (tầng level - 1) của một node trong
+        start = int(self.level_starts[level][idx])
+        children = np.arange(start, start + int(self.level_counts[level][idx]))
+        mbrs = self.level_mbrs[level - 1][children].astype(np.float64)
+        dists = haversine_vec(lon, lat, np.clip(lon, mbrs[:, 0], mbrs[:, 2]), np.clip(lat, mbrs[:, 1], mbrs[:, 3]))
+        return dists, children
+
+    def _nearest_points(self, idx, lon, lat):
+        # Khoảng cách tới từng điểm của một node lá
+        start = int(self.level_starts[0][idx])
+        children = np.arange(start, start + int(self.level_counts[0][idx]))
+        rad_lat = radians(lat)
+        dists = haversine_precomp(radians(lon), rad_lat, cos(rad_lat), self.point_rad_lon[children],
+                                  self.point_rad_lat[children], self.point_cos_lat[children])
+        return dists, children
 
     def nearest(self, point, k=1):
-        pq = []
-        counter = itertools.count()
-        heapq.heappush(pq, (0, next(counter), self.root))
-        results = []
-        while pq and len(results) < k:
-            dist, _, item = heapq.heappop(pq)
-            if isinstance(item, RTreeNode):
-                node = item
-                for mbr, child_or_id in node.entries:
-                    mbr_dist = self._mbr_distance(point, mbr)
-                    if node.is_leaf:
-                        heapq.heappush(pq, (mbr_dist, next(counter), child_or_id))
-                    else:
-                        heapq.heappush(pq, (mbr_dist, next(counter), child_or_id))
+        # Duyệt sâu, node con gần hơn được xét trước; k kết quả tốt nhất giữ trong hai list đã sắp xếp
+        # (chèn bằng bisect), node có khoảng cách MBR lớn hơn kết quả thứ k bị bỏ qua
+        if not self.level_mbrs or k <= 0:
+            return []
+        lon, lat = point
+        best_d, best_pos = [], []
+        stack = [(0.0, len(self.level_mbrs) - 1, 0)]
+        pop, push_all = stack.pop, stack.extend
+        bisect_right = bisect.bisect_right
+        nearest_points, nearest_nodes = self._nearest_points, self._nearest_nodes
+        while stack:
+            dist, level, idx = pop()
+            if len(best_d) == k and dist > best_d[-1]:
+                continue
+            if level == 0:
+                dists, children = nearest_points(idx, lon, lat)
+                if len(dists) > k:
+                    keep = np.argpartition(dists, k)[:k]
+                    dists, children = dists[keep], children[keep]
+                for d, pos in zip(dists.tolist(), children.tolist()):
+                    if len(best_d) < k or d < best_d[-1]:
+                        i = bisect_right(best_d, d)
+                        best_d.insert(i, d)
+                        best_pos.insert(i, pos)
+                        if len(best_d) > k:
+                            best_d.pop()
+                            best_pos.pop()
             else:
-                # item is data_id
-                results.append(item)
-        return results
+                dists, children = nearest_nodes(level, idx, lon, lat)
+                # Đưa node xa vào stack trước để node gần được lấy ra trước
+                order = np.argsort(dists)[::-1]
+                push_all(zip(dists[order].tolist(), [level - 1] * len(order), children[order].tolist()))
+        return self.point_ids[best_pos].tolist()
+
+# Lần lượt từng feature của file GeoJSON: có ijson thì đọc dạng stream, không dựng cả cây dict/list trong bộ nhớ
+def iter_features(filename):
+    if ijson is not None:
+        with open(filename, 'rb') as f:
+            yield from ijson.items(f, 'features.item', use_float=True)
+    else:
+        with open(filename, 'r', encoding='utf-8') as f:
+            yield from json.load(f)['features']
 
 # Đọc và parse dữ liệu từ GeoJSON
 def load_geojson(filename='export.geojson'):
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
+    # Mỗi Polygon chỉ giữ ring ngoài (mảng NumPy) và các thuộc tính cần dùng,
+    # feature đọc từ stream được bỏ ngay thay vì giữ lại cả danh sách feature
+    rings = []
     stations = []
-    for i, feature in enumerate(data['features']):
-        if feature['geometry']['type'] == 'Polygon':
-            coords = np.array(feature['geometry']['coordinates'][0])
-            centroid_lon = np.mean(coords[:, 0])
-            centroid_lat = np.mean(coords[:, 1])
-            
-            props = feature['properties']
-            name = props.get('name', 'Trạm xăng không tên')
-            brand = props.get('brand', 'Không rõ')
-            note = props.get('note', '')  
-            at_id = props.get('@id', 'Không có')  
-            
-            stations.append({
-                'id': i,
-                'name': name,
-                'brand': brand,
-                'note': note,
-                'lat': centroid_lat,
-                'lon': centroid_lon,
-                'at_id': at_id
-            })
+    for i, feature in enumerate(iter_features(filename)):
+        if feature['geometry']['type'] != 'Polygon':
+            continue
+        rings.append(np.asarray(feature['geometry']['coordinates'][0], dtype=np.float64).reshape(-1, 2))
+        props = feature['properties']
+        name = props.get('name', 'Trạm xăng không tên')
+        brand = props.get('brand', 'Không rõ')
+        note = props.get('note', '')  
+        at_id = props.get('@id', 'Không có')  
+        
+        stations.append({
+            'id': i,
+            'name': name,
+            'brand': brand,
+            'note': note,
+            'lat': 0.0,
+            'lon': 0.0,
+            'at_id': at_id
+        })
+    
+    # Tính centroid của tất cả Polygon cùng lúc: nối các ring ngoài thành một mảng
+    # rồi cộng theo từng đoạn bằng np.add.reduceat
+    lengths = np.array([len(ring) for ring in rings], dtype=np.int64)
+    centroids = np.empty((0, 2))
+    if rings:
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        centroids = np.add.reduceat(np.concatenate(rings), starts) / lengths[:, None]
+    
+    for station, (centroid_lon, centroid_lat) in zip(stations, centroids.tolist()):
+        station['lat'] = centroid_lat
+        station['lon'] = centroid_lon
     
     print(f'Đã tải {len(stations)} trạm xăng từ file {filename}.')
     return stations
@@ -176,43 +402,36 @@ def load_geojson(filename='export.geojson'):
 # Xây dựng R-Tree từ list stations
 def build_rtree(stations):
     rtree = RTree()
-    for station in stations:
-        point = (station['lon'], station['lat'])
-        rtree.insert(point, station['id'])
+    rtree.bulk_load([(station['lon'], station['lat']) for station in stations],
+                    [station['id'] for station in stations])
+    # Gọi thử một truy vấn để kernel Numba được biên dịch (hoặc nạp từ cache) ngay lúc khởi động
+    rtree.query_radius(0.0, 0.0, 0.0, 0.0, 0.0)
     return rtree
 
-# Tìm kiếm chính
-def search_stations(stations, rtree, user_lat, user_lon, radius_km):
+# Mảng toạ độ (lon, lat) của các trạm, tạo một lần để tính khoảng cách theo lô
+def station_coords(stations):
+    stations_lon = np.array([station['lon'] for station in stations], dtype=np.float64)
+    stations_lat = np.array([station['lat'] for station in stations], dtype=np.float64)
+    return stations_lon, stations_lat
+
+# Tìm kiếm chính: trả về hai mảng (id trạm, khoảng cách km) theo khoảng cách tăng dần;
+# dict trong stations chỉ dùng để hiển thị, toạ độ lấy từ các mảng
+def search_stations(stations, rtree, user_lat, user_lon, radius_km, stations_lon=None, stations_lat=None):
     km_to_deg_lat = radius_km / 111.0
     km_to_deg_lon = radius_km / (111.0 * cos(radians(user_lat)))
-    min_lon = user_lon - km_to_deg_lon
-    max_lon = user_lon + km_to_deg_lon
-    min_lat = user_lat - km_to_deg_lat
-    max_lat = user_lat + km_to_deg_lat
-    query_mbr = (min_lon, min_lat, max_lon, max_lat)
-    
-    candidates = rtree.intersection(query_mbr)
-    
-    results = []
-    for i in candidates:
-        station = stations[i]
-        dist = haversine(user_lon, user_lat, station['lon'], station['lat'])
-        if dist <= radius_km:
-            results.append((dist, station))
-    
-    results.sort(key=lambda x: x[0])
     
-    if results:
-        return results
+    # Lọc bán kính ngay trong lúc duyệt cây, rồi sắp các trạm trong bán kính theo khoảng cách tăng dần
+    ids, dists = rtree.query_radius(user_lon, user_lat, radius_km, km_to_deg_lon, km_to_deg_lat)
+    if len(ids):
+        order = np.argsort(dists, kind='stable')
+        return ids[order], dists[order]
     else:
+        if stations_lon is None or stations_lat is None:
+            stations_lon, stations_lat = station_coords(stations)
         point = (user_lon, user_lat)
-        nearest_ids = rtree.nearest(point, 2)
-        nearest_results = []
-        for i in nearest_ids:
-            station = stations[i]
-            dist = haversine(user_lon, user_lat, station['lon'], station['lat'])
-            nearest_results.append((dist, station))
-        return nearest_results
+        nearest_ids = np.array(rtree.nearest(point, 2), dtype=np.int64)
+        dists = haversine_vec(user_lon, user_lat, stations_lon[nearest_ids], stations_lat[nearest_ids])
+        return nearest_ids, dists
 
 # Lớp bridge để giao tiếp giữa JS và Python
 class MapBridge(QObject):
@@ -220,6 +439,7 @@ class MapBridge(QObject):
         super().__init__(parent)
         self.web_view = web_view
         self.stations = stations
+        self.stations_lon, self.stations_lat = station_coords(stations)
         self.rtree = rtree
         self.user_lat = None
         self.user_lon = None
@@ -235,64 +455,38 @@ class MapBridge(QObject):
             print("Vui lòng chọn điểm trên bản đồ trước.")
             return
 
-        results = search_stations(self.stations, self.rtree, self.user_lat, self.user_lon, radius_km)
+        ids, dists = search_stations(self.stations, self.rtree, self.user_lat, self.user_lon, radius_km,
+                                     self.stations_lon, self.stations_lat)
+        lats, lons = self.stations_lat[ids], self.stations_lon[ids]
         
-        # Xóa markers cũ
-        js_clear = "map.eachLayer(function(layer) { if (layer instanceof L.Marker) { map.removeLayer(layer); } });"
-        self.web_view.page().runJavaScript(js_clear)
-
-        # Thêm lại marker đỏ cho vị trí người dùng
-        js_user_marker = f"""
-        L.marker([{self.user_lat}, {self.user_lon}], {{icon: redIcon}}).addTo(map)
-            .bindPopup('Vị trí của bạn');
-        """
-        self.web_view.page().runJavaScript(js_user_marker)
-
-        # Thêm markers xanh cho kết quả
-        for dist, station in results:
+        # Xoá marker kết quả cũ và thêm toàn bộ marker xanh mới trong một lần runJavaScript: dữ liệu popup đi
+        # dưới dạng JSON, JS tự lặp để tạo marker và giữ lại trong resultMarkers cho lần tìm sau
+        # (marker đỏ của người dùng do sự kiện click trên bản đồ quản lý)
+        markers = []
+        for i, dist, lat, lon in zip(ids.tolist(), dists.tolist(), lats.tolist(), lons.tolist()):
+            station = self.stations[i]
             popup = f"{station['name']} ({station['brand']})<br>Khoảng cách: {dist:.2f} km<br>@id: {station['at_id']}"
             if station['note']:
                 popup += f"<br>Ghi chú: {station['note']}"
-            js_marker = f"""
-            L.marker([{station['lat']}, {station['lon']}], {{icon: greenIcon}}).addTo(map)
-                .bindPopup('{popup}');
-            """
-            self.web_view.page().runJavaScript(js_marker)
+            markers.append({'lat': lat, 'lon': lon, 'popup': popup})
+        js_markers = f"""
+        resultMarkers.forEach(function(m) {{ map.removeLayer(m); }});
+        resultMarkers = {json.dumps(markers, ensure_ascii=False)}.map(function(s) {{
+            return L.marker([s.lat, s.lon], {{icon: greenIcon}}).addTo(map).bindPopup(s.popup);
+        }});
+        """
 
         # Zoom vào khu vực
-        if results:
-            min_lat = min(station['lat'] for _, station in results)
-            min_lon = min(station['lon'] for _, station in results)
-            max_lat = max(station['lat'] for _, station in results)
-            max_lon = max(station['lon'] for _, station in results)
-            js_zoom = f"map.fitBounds([[{min_lat}, {min_lon}], [{max_lat}, {max_lon}]]);"
-            self.web_view.page().runJavaScript(js_zoom)
+        if len(ids):
+            min_lat, max_lat = lats.min(), lats.max()
+            min_lon, max_lon = lons.min(), lons.max()
+            js_markers += f"map.fitBounds([[{min_lat}, {min_lon}], [{max_lat}, {max_lon}]]);"
         else:
             print("Không tìm thấy trạm xăng trong bán kính.")
+        self.web_view.page().runJavaScript(js_markers)
 
-# GUI chính với PyQt
-class MainWindow(QMainWindow):
-    def __init__(self, stations, rtree):
-        super().__init__()
-        self.setWindowTitle("Tìm kiếm Trạm Xăng Gần Nhất")
-        self.setGeometry(100, 100, 800, 600)
-
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        layout = QVBoxLayout(central_widget)
-
-        # Web view cho bản đồ
-        self.web_view = QWebEngineView()
-        layout.addWidget(self.web_view)
-
-        # Channel cho giao tiếp JS-Python
-        self.channel = QWebChannel()
-        self.bridge = MapBridge(self, self.web_view, stations, rtree)
-        self.channel.registerObject('bridge', self.bridge)
-        self.web_view.page().setWebChannel(self.channel)
-
-        # Load HTML với Leaflet
-        html = """
+# HTML bản đồ Leaflet, được ghi ra map.html cạnh module
+MAP_HTML = """
         <!DOCTYPE html>
         <html style="height:100%;">
         <head>
@@ -328,6 +522,7 @@ class MainWindow(QMainWindow):
                 });
 
                 var userMarker;
+                var resultMarkers = [];  // marker kết quả của lần tìm gần nhất, chỉ các marker này bị xoá khi tìm lại
 
                 new QWebChannel(qt.webChannelTransport, function(channel) {
                     window.bridge = channel.objects.bridge;
@@ -344,15 +539,43 @@ class MainWindow(QMainWindow):
         </body>
         </html>
         """
+MAP_HTML_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'map.html')
+
+# Chỉ ghi lại map.html khi file chưa có hoặc nội dung khác MAP_HTML, để không ghi đè file mỗi lần mở cửa sổ
+def ensure_map_html():
+    try:
+        with open(MAP_HTML_FILE, 'r', encoding='utf-8') as f:
+            if f.read() == MAP_HTML:
+                return MAP_HTML_FILE
+    except FileNotFoundError:
+        pass
+    with open(MAP_HTML_FILE, 'w', encoding='utf-8') as f:
+        f.write(MAP_HTML)
+    return MAP_HTML_FILE
+
+# GUI chính với PyQt
+class MainWindow(QMainWindow):
+    def __init__(self, stations, rtree):
+        super().__init__()
+        self.setWindowTitle("Tìm kiếm Trạm Xăng Gần Nhất")
+        self.setGeometry(100, 100, 800, 600)
+
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        layout = QVBoxLayout(central_widget)
+
+        # Web view cho bản đồ
+        self.web_view = QWebEngineView()
+        layout.addWidget(self.web_view)
 
-        # Lưu HTML vào file tạm
-        html_file = 'map.html'
-        with open(html_file, 'w', encoding='utf-8') as f:
-            f.write(html)
+        # Channel cho giao tiếp JS-Python
+        self.channel = QWebChannel()
+        self.bridge = MapBridge(self, self.web_view, stations, rtree)
+        self.channel.registerObject('bridge', self.bridge)
+        self.web_view.page().setWebChannel(self.channel)
 
-        # Load từ file local
-        file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), html_file))
-        self.web_view.load(QUrl.fromLocalFile(file_path))
+        # Load map.html (Leaflet) từ file local cạnh module
+        self.web_view.load(QUrl.fromLocalFile(ensure_map_html()))
 
         # Controls
         control_layout = QHBoxLayout()
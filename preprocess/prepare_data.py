@@ -1,11 +1,51 @@
 import requests
 import json
+import shelve
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    import ijson
+except ImportError:  # ijson không bắt buộc, nếu chưa cài thì đọc cả file bằng json
+    ijson = None
+
+# Một Session dùng chung cho mọi lần gọi: giữ kết nối (keep-alive) thay vì bắt tay TCP/TLS lại mỗi trạm
+_session = requests.Session()
+_session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
+
+# Cache trên đĩa theo toạ độ làm tròn 5 chữ số: chạy lại thì bỏ qua các trạm đã hỏi, toạ độ trùng không gọi API lại
+CACHE_FILE = "nominatim_cache"
+_cache_lock = threading.Lock()  # shelve không an toàn khi nhiều thread cùng đọc/ghi
+
+# Nominatim chỉ cho phép khoảng 1 request/giây: các thread lần lượt lấy "lượt" bắt đầu request,
+# cách nhau MIN_REQUEST_INTERVAL giây, còn thời gian chờ phản hồi thì chạy chồng lên nhau
+MIN_REQUEST_INTERVAL = 1.0
+_rate_lock = threading.Lock()
+_next_request_time = 0.0
+
+MAX_WORKERS = 4
+REQUEST_TIMEOUT = 20  # giây, kết nối Nominatim bị treo thì báo lỗi thay vì giữ thread mãi
+CHECKPOINT_EVERY = 20  # ghi db.json sau mỗi CHECKPOINT_EVERY trạm
+
+def _wait_rate_limit():
+    global _next_request_time
+    with _rate_lock:
+        now = time.monotonic()
+        if _next_request_time > now:
+            time.sleep(_next_request_time - now)
+        _next_request_time = max(now, _next_request_time) + MIN_REQUEST_INTERVAL
 
 def get_address_from_coords(lat: float, lon: float):
+    key = f"{round(lat, 5)},{round(lon, 5)}"
+    with _cache_lock, shelve.open(CACHE_FILE) as cache:
+        if key in cache:
+            return dict(cache[key])
+
     # Gọi API
-    url = f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lon}&format=json"
-    header ={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"}
-    response = requests.get(url, headers=header)
+    url = "https://nominatim.openstreetmap.org/reverse"
+    _wait_rate_limit()
+    response = _session.get(url, params={"lat": lat, "lon": lon, "format": "json"},
+                            timeout=REQUEST_TIMEOUT)
     if response.status_code != 200:
         raise Exception("Lỗi khi gọi API.")
 
@@ -42,72 +82,94 @@ def get_address_from_coords(lat: float, lon: float):
         "display_name": display_name
     }
 
-    return result
-
-
-
-def main():
+    with _cache_lock, shelve.open(CACHE_FILE) as cache:
+        cache[key] = result
 
-    # Ví dụ sử dụng
-    # coords = "20.8574295,106.6838112"
-    # try:
-    #     result_json = get_address_from_coords(coords)
-    #     print(json.dumps(result_json, ensure_ascii=False, indent=4))
-    # except Exception as e:
-    #     print(f"Lỗi: {str(e)}")
+    return result
 
 
-    #result:
 
-    f2 = open("db.json", "w", encoding="utf-8")
-    
-    output = []
+# Lần lượt từng feature của file GeoJSON: có ijson thì đọc dạng stream, không dựng cả cây dict/list trong bộ nhớ
+def iter_features(filename):
+    if ijson is not None:
+        with open(filename, "rb") as f:
+            yield from ijson.items(f, "features.item", use_float=True)
+    else:
+        with open(filename, "r", encoding="utf-8") as f:
+            yield from json.load(f)["features"]
 
-    try:
-        # read geojson
-        f = open("export.geojson", "r", encoding="utf-8")
-        data = json.load(f)
 
-        gas_stations = data["features"]
+def station_fields(gas_station):
+    # Chỉ lấy toạ độ và các thuộc tính cần dùng, future đang chờ không giữ lại cả feature
+    gas_pos = gas_station["geometry"]["coordinates"][0][0]
+    props = gas_station.get("properties", {})
+    return gas_pos[1], gas_pos[0], props.get("name", ""), props.get("brand", ""), props.get("@id", "")
 
-        counter = 0
 
-        for i in range(467, len(gas_stations)):
+def process_station(i, lat, lon, name, brand, id):
+    print(f"checking {i}: {lat}, {lon}")
 
-            gas_station = gas_stations[i]
+    result = get_address_from_coords(lat, lon)
 
-            gas_pos = gas_station["geometry"]["coordinates"][0][0]
+    province = result.get("province", "")
+    ward = result.get("ward", "")
+    display_name = result.get("display_name", "")
 
-            lat = gas_pos[1]
-            lon = gas_pos[0]
+    return {"name": name, "brand": brand, "display_name": display_name,
+            "ward": ward, "province": province, "coordinates":[lat, lon],
+            "id": id
+            }
 
-            print(f"checking {counter}: {lat}, {lon}")
 
-            name = gas_station.get("properties","").get("name", "")
-            brand = gas_station.get("properties", "").get("brand", "")
-            id = gas_station.get("properties", "").get("@id", "")
+def write_output(output):
+    # Ghi theo đúng thứ tự trạm trong export.geojson, bất kể thread nào xong trước
+    with open("db.json", "w", encoding="utf-8") as f2:
+        json.dump([output[i] for i in sorted(output)], f2, ensure_ascii=False, indent=4)
 
-            result = get_address_from_coords(lat, lon)
 
-            province = result.get("province", "")
-            ward = result.get("ward", "")
-            display_name = result.get("display_name", "")
+def main():
 
-            gas_station_new = {"name": name, "brand": brand, "display_name": display_name,
-                                "ward": ward, "province": province, "coordinates":[lat, lon],
-                                "id": id
-                                }
+    # Ví dụ sử dụng
+    # coords = "20.8574295,106.6838112"
+    # try:
+    #     result_json = get_address_from_coords(coords)
+    #     print(json.dumps(result_json, ensure_ascii=False, indent=4))
+    # except Exception as e:
+    #     print(f"Lỗi: {str(e)}")
 
 
-            output.append(gas_station_new)
-            counter += 1
-    except Exception as e:
-        json.dump(output, f2, ensure_ascii=False, indent=4)
-        f2.close()
+    #result:
 
-        
-    json.dump(output, f2, ensure_ascii=False, indent=4)
-    f2.close()
+    output = {}
+
+    # Nhiều thread gọi API cùng lúc (vẫn giữ giới hạn tốc độ), kết quả gom theo chỉ số trạm.
+    # Đọc geojson dạng stream nên các request bắt đầu ngay khi trạm đầu tiên được đọc xong,
+    # mỗi trạm chờ xử lý chỉ giữ toạ độ và vài thuộc tính
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}
+        for i, gas_station in enumerate(iter_features("export.geojson")):
+            if i < 467:
+                continue
+            try:
+                fields = station_fields(gas_station)
+            except Exception as e:
+                # Feature không đúng dạng (vd. Point): dừng nạp thêm, các trạm đã gửi vẫn được ghi
+                print(f"Lỗi: {str(e)}")
+                break
+            futures[executor.submit(process_station, i, *fields)] = i
+        for future in as_completed(futures):
+            try:
+                output[futures[future]] = future.result()
+            except Exception as e:
+                # Lỗi thì dừng các trạm chưa chạy và ghi lại những gì đã có
+                print(f"Lỗi: {str(e)}")
+                for pending in futures:
+                    pending.cancel()
+                break
+            if len(output) % CHECKPOINT_EVERY == 0:
+                write_output(output)
+
+    write_output(output)
 
 
 
@@ -1,5 +1,5 @@
 import json
-import random
+import numpy as np
 
 # Assume the input file name is 'input.json'. Replace with the actual file name if different.
 input_file = 'db_fix.json'
@@ -11,40 +11,28 @@ with open(input_file, 'r', encoding='utf-8') as f:
 
 # Extract min and max coordinates for random generation
 if data:
-    lats = [point['coordinates'][0] for point in data]
-    lons = [point['coordinates'][1] for point in data]
-    min_lat = min(lats)
-    max_lat = max(lats)
-    min_lon = min(lons)
-    max_lon = max(lons)
+    coords = np.array([point['coordinates'] for point in data], dtype=np.float64)
+    min_lat, min_lon = coords.min(axis=0)
+    max_lat, max_lon = coords.max(axis=0)
 else:
     raise ValueError("No data in the input file to determine coordinate bounds.")
 
-# Track used coordinates to avoid duplicates (including originals)
-used_coords = set(tuple(point['coordinates']) for point in data)
-
 # Prompt user for the number of random points
 num_random = int(input("Enter the number of random points to generate: "))
+# A negative count generates no points, as the old per-point loop did
+num_random = max(num_random, 0)
+
+# Generate all random coordinates within the bounds at once. Two uniform floats
+# practically never collide, so no duplicate check is needed
+rand_lats = np.random.uniform(min_lat, max_lat, num_random).tolist()
+rand_lons = np.random.uniform(min_lon, max_lon, num_random).tolist()
+
+# Select a random original point to base each new one on
+originals = np.random.randint(len(data), size=num_random).tolist()
 
-# Generate random points
-new_points = []
-for _ in range(num_random):
-    while True:
-        # Generate random coordinates within the bounds
-        rand_lat = random.uniform(min_lat, max_lat)
-        rand_lon = random.uniform(min_lon, max_lon)
-        rand_coord = (rand_lat, rand_lon)
-        
-        # Check if unique
-        if rand_coord not in used_coords:
-            used_coords.add(rand_coord)
-            break
-    
-    # Select a random original point to base the new one on
-    original = random.choice(data)
-    
-    # Create new point with [RAND] prefixed to specified fields
-    new_point = {
+# Create new points with [RAND] prefixed to specified fields
+new_points = [
+    {
         "name": "[RAND]" + original["name"],
         "brand": "[RAND]" + original["brand"],
         "display_name": "[RAND]" + original["display_name"],
@@ -53,8 +41,8 @@ for _ in range(num_random):
         "coordinates": [rand_lat, rand_lon],
         "id": "[RAND]" + original["id"]  # Also prefix id for consistency
     }
-    
-    new_points.append(new_point)
+    for rand_lat, rand_lon, original in zip(rand_lats, rand_lons, (data[i] for i in originals))
+]
 
 # Combine original and new points
 all_points = data + new_points